@@ -0,0 +1,345 @@
+"""
+Module to compute derived climate quantities from the stored samples.
+
+For every station and day it keeps the trailing rolling mean of the daily mean
+temperature and the heating and cooling degree days (against `base_temp`,
+18 °C by default). For every station and calendar day it keeps the sums
+behind a day-of-year climatology, from which anomalies are computed on read,
+and the record high and low with the days they were set.
+
+Everything is persisted next to the samples and brought up to date
+incrementally: only the days after the station's watermark are processed,
+reading the `window` days before them for the rolling mean, so a new day costs
+O(window) work. If days older than the watermark were inserted since (for
+example by a backfill), the station is rebuilt from scratch.
+
+Calendar days are numbered 0-365 as in a leap year, so February 29 has its own
+climatology and records, and March 1 is day 60 in every year.
+
+Usage:
+    python analytics.py update [STATION ...]
+    python analytics.py records 27174
+"""
+
+import argparse
+import numpy as np
+from db_operations import DBOperations, DB_NAME, to_day_number
+
+DEFAULT_WINDOW = 30
+DEFAULT_BASE_TEMP = 18.0
+CALENDAR_DAYS = 366
+
+
+def calendar_days(days):
+    """Number days since 1970-01-01 by their day of a leap year (0-365)."""
+    dates = np.asarray(days, dtype=np.int64).astype("datetime64[D]")
+    years = dates.astype("datetime64[Y]")
+    index = (dates - years).astype(np.int64)
+    year = years.astype(np.int64) + 1970
+    leap = (year % 4 == 0) & ((year % 100 != 0) | (year % 400 == 0))
+    return index + ((~leap) & (index >= 59))
+
+
+def rolling_mean(days, values, window):
+    """
+    Mean of the values in the `window` calendar days ending on each day, with
+    missing days and NaN values left out (NaN if there are none). `days` must
+    be sorted and unique.
+    """
+    if len(days) == 0:
+        return np.empty(0)
+    offsets = days - days[0]
+    valid = ~np.isnan(values)
+    sums = np.zeros(offsets[-1] + 2)
+    counts = np.zeros(offsets[-1] + 2)
+    sums[offsets[valid] + 1] = values[valid]
+    counts[offsets[valid] + 1] = 1
+    np.cumsum(sums, out=sums)
+    np.cumsum(counts, out=counts)
+    upper = offsets + 1
+    lower = np.maximum(upper - window, 0)
+    count = counts[upper] - counts[lower]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(count > 0, (sums[upper] - sums[lower]) / count, np.nan)
+
+
+def extremes(keys, values, days, highest):
+    """
+    Return (keys, values, days) of the highest (or lowest) value per key,
+    ignoring NaN. Ties go to the earliest day.
+    """
+    valid = ~np.isnan(values)
+    keys, values, days = keys[valid], values[valid], days[valid]
+    if len(keys) == 0:
+        return keys, values, days
+    ranked = -values if highest else values
+    order = np.lexsort((days, ranked, keys))  # by key, then best value, then earliest day
+    keys, values, days = keys[order], values[order], days[order]
+    first = np.flatnonzero(np.diff(keys, prepend=keys[0] - 1))
+    return keys[first], values[first], days[first]
+
+
+def nullable(values):
+    """Turn an array into a list with None in place of NaN, for SQLite."""
+    return [None if value != value else value for value in values.tolist()]
+
+
+class Analytics:
+    """
+    Derived climate quantities of the stations in a database. The fetch methods
+    bring the station up to date first, which costs a sum over the station's
+    monthly_stats rows and a count of the days after its watermark when no
+    new days have arrived.
+    """
+    def __init__(self, db=None, window=DEFAULT_WINDOW, base_temp=DEFAULT_BASE_TEMP):
+        self.db = db if db is not None else DBOperations()
+        self.window = window
+        self.base_temp = base_temp
+        self.initialize()
+
+    def initialize(self):
+        """Create the analytics tables if they don't exist."""
+        with self.db.connect() as cursor:
+            cursor.execute("""CREATE TABLE IF NOT EXISTS analytics_state (
+                                station_id INTEGER PRIMARY KEY NOT NULL,
+                                last_day INTEGER NOT NULL,
+                                sample_count INTEGER NOT NULL,
+                                window_days INTEGER NOT NULL,
+                                base_temp REAL NOT NULL
+                            );""")
+            cursor.execute("""CREATE TABLE IF NOT EXISTS analytics_daily (
+                                station_id INTEGER NOT NULL,
+                                day INTEGER NOT NULL,
+                                rolling_mean REAL,
+                                hdd REAL,
+                                cdd REAL,
+                                PRIMARY KEY (station_id, day)
+                            ) WITHOUT ROWID;""")
+            cursor.execute("""CREATE TABLE IF NOT EXISTS analytics_climatology (
+                                station_id INTEGER NOT NULL,
+                                calendar_day INTEGER NOT NULL,
+                                count INTEGER NOT NULL,
+                                sum REAL NOT NULL,
+                                sum_sq REAL NOT NULL,
+                                PRIMARY KEY (station_id, calendar_day)
+                            ) WITHOUT ROWID;""")
+            cursor.execute("""CREATE TABLE IF NOT EXISTS analytics_records (
+                                station_id INTEGER NOT NULL,
+                                calendar_day INTEGER NOT NULL,
+                                high REAL,
+                                high_day INTEGER,
+                                low REAL,
+                                low_day INTEGER,
+                                PRIMARY KEY (station_id, calendar_day)
+                            ) WITHOUT ROWID;""")
+
+    def update(self, station_id=None):
+        """
+        Process the days that arrived since the last update, for one station or
+        every station with samples. Returns the number of days processed.
+        """
+        if station_id is None:
+            with self.db.connect() as cursor:
+                cursor.execute("SELECT DISTINCT station_id FROM monthly_stats")
+                station_ids = [row[0] for row in cursor.fetchall()]
+            return sum(self.update(station_id) for station_id in station_ids)
+
+        with self.db.connect() as cursor:
+            cursor.execute("BEGIN IMMEDIATE")
+            cursor.execute("""SELECT last_day, sample_count, window_days, base_temp FROM analytics_state
+                              WHERE station_id = ?""", (station_id,))
+            state = cursor.fetchone()
+            # monthly_stats counts every stored day, so the total needs no scan of the samples
+            cursor.execute("SELECT COALESCE(SUM(count), 0) FROM monthly_stats WHERE station_id = ?",
+                           (station_id,))
+            total = cursor.fetchone()[0]
+            if state is not None and tuple(state[2:]) == (self.window, self.base_temp):
+                last_day, processed = state[0], state[1]
+                cursor.execute("SELECT COUNT(*) FROM samples WHERE station_id = ? AND day > ?",
+                               (station_id, last_day))
+                new = cursor.fetchone()[0]
+                if new == 0 and total == processed:
+                    return 0
+                if total - new != processed:  # older days were inserted (or the data was purged)
+                    print(f"Rebuilding the analytics of station {station_id}...")
+                    last_day = None
+            else:
+                last_day = None
+
+            if last_day is None:
+                for table in ("analytics_daily", "analytics_climatology", "analytics_records"):
+                    cursor.execute(f"DELETE FROM {table} WHERE station_id = ?", (station_id,))
+                cursor.execute("""SELECT day, min_temp, max_temp, avg_temp FROM samples
+                                  WHERE station_id = ? ORDER BY day""", (station_id,))
+            else:
+                cursor.execute("""SELECT day, min_temp, max_temp, avg_temp FROM samples
+                                  WHERE station_id = ? AND day > ? ORDER BY day""",
+                               (station_id, last_day - self.window))
+            rows = cursor.fetchall()
+            if not rows:
+                cursor.execute("DELETE FROM analytics_state WHERE station_id = ?", (station_id,))
+                return 0
+            table = np.array(rows, dtype=np.float64)  # NULL becomes NaN
+            days = table[:, 0].astype(np.int64)
+            new_days = self.process(cursor, station_id, days, table[:, 1], table[:, 2], table[:, 3],
+                                    first_new=0 if last_day is None else np.searchsorted(days, last_day, "right"))
+            cursor.execute("""INSERT OR REPLACE INTO analytics_state
+                              (station_id, last_day, sample_count, window_days, base_temp)
+                              VALUES (?, ?, ?, ?, ?)""",
+                           (station_id, int(days[-1]), total, self.window, self.base_temp))
+            return new_days
+
+    def process(self, cursor, station_id, days, min_temp, max_temp, avg_temp, first_new):
+        """
+        Store the derived values of the days from index `first_new` on; the days
+        before it are only there to fill the rolling window. Returns the number
+        of days processed.
+        """
+        rolling = rolling_mean(days, avg_temp, self.window)[first_new:]
+        days, min_temp, max_temp, avg_temp = (days[first_new:], min_temp[first_new:],
+                                              max_temp[first_new:], avg_temp[first_new:])
+        hdd = np.maximum(self.base_temp - avg_temp, 0.0)
+        cdd = np.maximum(avg_temp - self.base_temp, 0.0)
+        cursor.executemany("""INSERT OR REPLACE INTO analytics_daily (station_id, day, rolling_mean, hdd, cdd)
+                              VALUES (?, ?, ?, ?, ?)""",
+                           zip([station_id] * len(days), days.tolist(), nullable(rolling),
+                               nullable(hdd), nullable(cdd)))
+
+        calendar_day = calendar_days(days)
+        valid = ~np.isnan(avg_temp)
+        counts = np.bincount(calendar_day[valid], minlength=CALENDAR_DAYS)
+        sums = np.bincount(calendar_day[valid], avg_temp[valid], minlength=CALENDAR_DAYS)
+        sums_sq = np.bincount(calendar_day[valid], avg_temp[valid] ** 2, minlength=CALENDAR_DAYS)
+        touched = np.flatnonzero(counts)
+        cursor.executemany("""INSERT INTO analytics_climatology (station_id, calendar_day, count, sum, sum_sq)
+                              VALUES (?, ?, ?, ?, ?)
+                              ON CONFLICT (station_id, calendar_day) DO UPDATE SET
+                                  count = count + excluded.count,
+                                  sum = sum + excluded.sum,
+                                  sum_sq = sum_sq + excluded.sum_sq""",
+                           zip([station_id] * len(touched), touched.tolist(), counts[touched].tolist(),
+                               sums[touched].tolist(), sums_sq[touched].tolist()))
+
+        records = {}
+        for key, value, day in zip(*extremes(calendar_day, max_temp, days, highest=True)):
+            records[int(key)] = [float(value), int(day), None, None]
+        for key, value, day in zip(*extremes(calendar_day, min_temp, days, highest=False)):
+            records.setdefault(int(key), [None, None, None, None])[2:] = [float(value), int(day)]
+        cursor.executemany("""INSERT INTO analytics_records (station_id, calendar_day, high, high_day, low, low_day)
+                              VALUES (?, ?, ?, ?, ?, ?)
+                              ON CONFLICT (station_id, calendar_day) DO UPDATE SET
+                                  high = CASE WHEN high IS NULL OR excluded.high > high
+                                              THEN excluded.high ELSE high END,
+                                  high_day = CASE WHEN high IS NULL OR excluded.high > high
+                                                  THEN excluded.high_day ELSE high_day END,
+                                  low = CASE WHEN low IS NULL OR excluded.low < low
+                                             THEN excluded.low ELSE low END,
+                                  low_day = CASE WHEN low IS NULL OR excluded.low < low
+                                                 THEN excluded.low_day ELSE low_day END""",
+                           [(station_id, key, *values) for key, values in records.items()])
+        return len(days)
+
+    def fetch_climatology(self, station_id):
+        """
+        Return the climatology of a station as arrays indexed by calendar day:
+        "count", "mean" and "std" of the daily mean temperature (NaN without data).
+        """
+        self.update(station_id)
+        counts, sums, sums_sq = np.zeros(CALENDAR_DAYS), np.zeros(CALENDAR_DAYS), np.zeros(CALENDAR_DAYS)
+        with self.db.connect() as cursor:
+            cursor.execute("""SELECT calendar_day, count, sum, sum_sq FROM analytics_climatology
+                              WHERE station_id = ?""", (station_id,))
+            for calendar_day, count, total, total_sq in cursor.fetchall():
+                counts[calendar_day], sums[calendar_day], sums_sq[calendar_day] = count, total, total_sq
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = sums / counts
+            std = np.sqrt(np.maximum(sums_sq / counts - mean ** 2, 0.0))
+        return {"count": counts.astype(np.int64), "mean": mean, "std": std}
+
+    def fetch_daily(self, station_id, start_date=None, end_date=None):
+        """
+        Return the derived values of a station's days, optionally between two
+        dates (inclusive), as arrays: "date" (datetime64[D]), "avg_temp",
+        "rolling_mean", "hdd", "cdd" and "anomaly" (the difference from the
+        climatology mean of the calendar day).
+        """
+        climatology = self.fetch_climatology(station_id)
+        conditions, params = ["s.station_id = ?"], [station_id]
+        if start_date and end_date:
+            conditions.append("s.day BETWEEN ? AND ?")
+            params.extend((to_day_number(start_date), to_day_number(end_date)))
+        with self.db.connect() as cursor:
+            cursor.execute(f"""SELECT s.day, s.avg_temp, a.rolling_mean, a.hdd, a.cdd
+                               FROM samples s JOIN analytics_daily a
+                                   ON a.station_id = s.station_id AND a.day = s.day
+                               WHERE {' AND '.join(conditions)}
+                               ORDER BY s.day""", params)
+            table = np.array(cursor.fetchall(), dtype=np.float64).reshape(-1, 5)
+        days = table[:, 0].astype(np.int64)
+        return {
+            "date": days.astype("datetime64[D]"),
+            "avg_temp": table[:, 1],
+            "rolling_mean": table[:, 2],
+            "hdd": table[:, 3],
+            "cdd": table[:, 4],
+            "anomaly": table[:, 1] - climatology["mean"][calendar_days(days)],
+        }
+
+    def fetch_degree_days(self, station_id, start_year, end_year):
+        """
+        Return the monthly totals of heating and cooling degree days in a range of
+        years, as a dictionary mapping (year, month) to (hdd, cdd).
+        """
+        self.update(station_id)
+        start, end = to_day_number(f"{start_year}-01-01"), to_day_number(f"{end_year}-12-31")
+        with self.db.connect() as cursor:
+            cursor.execute("""SELECT CAST(strftime('%Y', day * 86400, 'unixepoch') AS INTEGER) AS year,
+                                     CAST(strftime('%m', day * 86400, 'unixepoch') AS INTEGER) AS month,
+                                     SUM(hdd), SUM(cdd)
+                              FROM analytics_daily
+                              WHERE station_id = ? AND day BETWEEN ? AND ?
+                              GROUP BY year, month ORDER BY year, month""", (station_id, start, end))
+            return {(row[0], row[1]): (row[2], row[3]) for row in cursor.fetchall()}
+
+    def fetch_records(self, station_id):
+        """
+        Return the record high and low of every calendar day of a station as a
+        dictionary mapping calendar day to (high, high_date, low, low_date),
+        with dates as 'YYYY-MM-DD' strings.
+        """
+        self.update(station_id)
+        with self.db.connect() as cursor:
+            cursor.execute("""SELECT calendar_day, high, high_day, low, low_day FROM analytics_records
+                              WHERE station_id = ? ORDER BY calendar_day""", (station_id,))
+            rows = cursor.fetchall()
+        as_date = lambda day: None if day is None else str(np.datetime64(int(day), "D"))
+        return {row[0]: (row[1], as_date(row[2]), row[3], as_date(row[4])) for row in rows}
+
+
+def calendar_day_label(calendar_day):
+    """Format a calendar day (0-365) as 'MM-DD'."""
+    return str(np.datetime64("2000-01-01") + np.timedelta64(calendar_day, "D"))[5:]
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Update or show derived climate statistics.")
+    arg_parser.add_argument("command", choices=("update", "records"))
+    arg_parser.add_argument("stations", type=int, nargs="*", help="station ids (default: every station)")
+    arg_parser.add_argument("--window", type=int, default=DEFAULT_WINDOW, help="rolling mean window in days")
+    arg_parser.add_argument("--base-temp", type=float, default=DEFAULT_BASE_TEMP,
+                            help="base temperature of the degree days (°C)")
+    arg_parser.add_argument("--db", default=DB_NAME, help="SQLite database")
+    args = arg_parser.parse_args()
+
+    db = DBOperations(args.db)
+    db.initialize_db()
+    analytics = Analytics(db, window=args.window, base_temp=args.base_temp)
+    if args.command == "update":
+        for station_id in args.stations or [None]:
+            days = analytics.update(station_id)
+            print(f"Processed {days} new day(s) for {'every station' if station_id is None else station_id}.")
+    else:
+        for station_id in args.stations:
+            print(f"Records of station {station_id}:")
+            for calendar_day, (high, high_date, low, low_date) in analytics.fetch_records(station_id).items():
+                print(f"  {calendar_day_label(calendar_day)}: high {high} ({high_date}), low {low} ({low_date})")
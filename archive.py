@@ -0,0 +1,257 @@
+"""
+Module to export samples to a compact columnar file and read it back memory-mapped.
+
+An archive holds the samples of one or more stations sorted by (station, day)
+as four flat columns, so a reader can map the file and hand out NumPy views of
+any station and date range without copying or parsing anything. Processes
+that map the same archive share its pages through the OS page cache.
+
+Layout (all integers little-endian, every section starts on an 8-byte boundary):
+
+    offset 0   header, 64 bytes
+               magic      8 bytes   b"WXARCH\\x00\\x01"
+               version    uint32    1
+               stations   uint32    number of stations, S
+               rows       uint64    number of samples, N
+               names_off  uint64    offset of the station names
+               names_len  uint64    length of the station names
+               (zero padding to 64 bytes)
+    64         directory, S records of 24 bytes, sorted by station_id
+               station_id int64
+               first_row  int64     index of the station's first sample
+               row_count  int64
+    then       day        int64[N]    days since 1970-01-01, ascending per station
+               min_temp   float64[N]  NaN where the value is missing
+               max_temp   float64[N]
+               avg_temp   float64[N]
+    names_off  station names as UTF-8 JSON, {"station_id": "name"}
+
+Days are stored as int64 so the day column can be viewed as datetime64[D]
+without a copy.
+
+Usage:
+    python archive.py export weather.wxa [--stations 27174 51097]
+    python archive.py import weather.wxa
+    python archive.py info weather.wxa
+"""
+
+import argparse
+import json
+import mmap
+import numpy as np
+from db_operations import DBOperations, DB_NAME, to_day_number
+
+MAGIC = b"WXARCH\x00\x01"
+VERSION = 1
+HEADER = np.dtype([("magic", "S8"), ("version", "<u4"), ("stations", "<u4"), ("rows", "<u8"),
+                   ("names_offset", "<u8"), ("names_length", "<u8"), ("padding", "V24")])
+DIRECTORY = np.dtype([("station_id", "<i8"), ("first_row", "<i8"), ("row_count", "<i8")])
+COLUMNS = (("day", "<i8"), ("min_temp", "<f8"), ("max_temp", "<f8"), ("avg_temp", "<f8"))
+EXPORT_BATCH_ROWS = 100000
+IMPORT_BATCH_ROWS = 100000
+
+
+def align(offset, boundary=8):
+    """Round an offset up to the next multiple of `boundary`."""
+    return (offset + boundary - 1) // boundary * boundary
+
+
+def column_offsets(n_stations, n_rows):
+    """Return the byte offset of every column and the end of the last one."""
+    offsets = {}
+    offset = align(HEADER.itemsize + n_stations * DIRECTORY.itemsize)
+    for name, dtype in COLUMNS:
+        offsets[name] = offset
+        offset = align(offset + n_rows * np.dtype(dtype).itemsize)
+    return offsets, offset
+
+
+def export_archive(db, path, station_ids=None):
+    """
+    Write the samples of `station_ids` (default: every station) to an archive
+    at `path`. Rows are copied in batches straight into the mapped output file,
+    so memory use does not grow with the table. Everything is read in one
+    transaction, so rows committed by other writers meanwhile cannot change the
+    counts the archive was laid out with. Returns the number of rows written.
+    """
+    with db.connect() as cursor:
+        cursor.execute("BEGIN")
+        cursor.execute("SELECT station_id, COUNT(*) FROM samples GROUP BY station_id ORDER BY station_id")
+        counts = [(station_id, count) for station_id, count in cursor.fetchall()
+                  if station_ids is None or station_id in station_ids]
+        cursor.execute("SELECT station_id, name FROM stations")  # not fetch_stations, which would commit
+        names = dict(cursor.fetchall())
+
+        directory = np.zeros(len(counts), dtype=DIRECTORY)
+        if counts:
+            directory["station_id"] = [station_id for station_id, _ in counts]
+            directory["row_count"] = [count for _, count in counts]
+            directory["first_row"][1:] = np.cumsum(directory["row_count"])[:-1]
+        n_rows = int(directory["row_count"].sum())
+        offsets, names_offset = column_offsets(len(counts), n_rows)
+        names_blob = json.dumps({str(station_id): names.get(station_id) for station_id, _ in counts}).encode()
+
+        header = np.zeros(1, dtype=HEADER)
+        header[0] = (MAGIC, VERSION, len(counts), n_rows, names_offset, len(names_blob), b"")
+        with open(path, "wb") as f:
+            f.write(header.tobytes())
+            f.write(directory.tobytes())
+            f.truncate(names_offset)
+            f.seek(names_offset)
+            f.write(names_blob)
+
+        if n_rows:
+            output = np.memmap(path, mode="r+")
+            columns = {name: output[offsets[name]:offsets[name] + n_rows * np.dtype(dtype).itemsize].view(dtype)
+                       for name, dtype in COLUMNS}
+            for station_id, first_row, row_count in directory:
+                cursor.execute("""SELECT day, min_temp, max_temp, avg_temp FROM samples
+                                  WHERE station_id = ? ORDER BY day""", (int(station_id),))
+                row, end = int(first_row), int(first_row + row_count)
+                while True:
+                    batch = cursor.fetchmany(min(EXPORT_BATCH_ROWS, end - row + 1))
+                    if not batch:
+                        break
+                    if row + len(batch) > end:
+                        raise RuntimeError(f"Station {station_id} has more rows than counted")
+                    table = np.array(batch, dtype=np.float64)  # NULL becomes NaN
+                    for index, (name, _) in enumerate(COLUMNS):
+                        columns[name][row:row + len(batch)] = table[:, index]
+                    row += len(batch)
+                if row != end:
+                    raise RuntimeError(f"Station {station_id} has fewer rows than counted")
+            output.flush()
+            del columns, output
+    return n_rows
+
+
+class Archive:
+    """
+    Read-only, memory-mapped archive. Columns are views of the mapped file:
+    nothing is read until it is used, and nothing is copied.
+
+    Use as a context manager, or call close() once no view is in use any more
+    (mmap refuses to close while views of it exist).
+    """
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self.map) < HEADER.itemsize:
+            self.map.close()
+            raise ValueError(f"Not a weather archive: {path}")
+        header = np.frombuffer(self.map, dtype=HEADER, count=1)[0]
+        if header["magic"] != MAGIC or header["version"] != VERSION:
+            del header
+            self.map.close()
+            raise ValueError(f"Not a weather archive (or an unsupported version): {path}")
+        n_stations, self.rows = int(header["stations"]), int(header["rows"])
+        names_offset, names_length = int(header["names_offset"]), int(header["names_length"])
+        del header
+
+        self.directory = np.frombuffer(self.map, dtype=DIRECTORY, count=n_stations, offset=HEADER.itemsize)
+        offsets, _ = column_offsets(n_stations, self.rows)
+        self.columns = {name: np.frombuffer(self.map, dtype=dtype, count=self.rows, offset=offsets[name])
+                        for name, dtype in COLUMNS}
+        self.names = {int(station_id): name for station_id, name in
+                      json.loads(self.map[names_offset:names_offset + names_length]).items()}
+
+    def stations(self):
+        """Return a dictionary mapping every station id in the archive to its name."""
+        return dict(self.names)
+
+    def station_rows(self, station_id):
+        """Return the (first_row, row_count) of a station, or (0, 0) if it is not in the archive."""
+        index = np.searchsorted(self.directory["station_id"], station_id)
+        if index == len(self.directory) or self.directory["station_id"][index] != station_id:
+            return 0, 0
+        return int(self.directory["first_row"][index]), int(self.directory["row_count"][index])
+
+    def fetch_columns(self, station_id, start_date=None, end_date=None):
+        """
+        Return the samples of a station, optionally between two dates (inclusive,
+        'YYYY-MM-DD' strings or dates), in the same shape as
+        DBOperations.fetch_columns. Every array is a read-only view of the file.
+        """
+        first, count = self.station_rows(station_id)
+        days = self.columns["day"][first:first + count]
+        start, stop = 0, count
+        if start_date is not None:
+            start = int(np.searchsorted(days, to_day_number(start_date), side="left"))
+        if end_date is not None:
+            stop = int(np.searchsorted(days, to_day_number(end_date), side="right"))
+        stop = max(start, stop)
+        rows = slice(first + start, first + stop)
+        return {
+            "station_id": np.broadcast_to(np.int64(station_id), (stop - start,)),
+            "date": self.columns["day"][rows].view("datetime64[D]"),
+            "min_temp": self.columns["min_temp"][rows],
+            "max_temp": self.columns["max_temp"][rows],
+            "avg_temp": self.columns["avg_temp"][rows],
+        }
+
+    def close(self):
+        """Unmap the file. Views handed out earlier must have been released."""
+        self.columns = {}
+        self.directory = None
+        self.map.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def import_archive(path, db):
+    """
+    Load every sample of an archive into the database through save_rows, so
+    monthly statistics and coverage are maintained and existing days are kept.
+    Returns the number of rows inserted.
+    """
+    archive = Archive(path)
+    inserted = 0
+    try:
+        for station_id, name in archive.stations().items():
+            db.add_station(station_id, name or f"Station {station_id}")
+        for station_id, first_row, row_count in archive.directory.tolist():
+            for start in range(first_row, first_row + row_count, IMPORT_BATCH_ROWS):
+                stop = min(start + IMPORT_BATCH_ROWS, first_row + row_count)
+                columns = [archive.columns[name][start:stop].tolist() for name, _ in COLUMNS]
+                rows = [(station_id, day, *[None if value != value else value for value in temps])
+                        for day, *temps in zip(*columns)]
+                count = db.save_rows(rows)
+                if count is None:
+                    raise RuntimeError(f"Could not import station {station_id}")
+                inserted += count
+                del columns
+    finally:
+        archive.close()
+    return inserted
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Export or import a columnar weather archive.")
+    arg_parser.add_argument("command", choices=("export", "import", "info"))
+    arg_parser.add_argument("path", help="archive file")
+    arg_parser.add_argument("--db", default=DB_NAME, help="SQLite database")
+    arg_parser.add_argument("--stations", type=int, nargs="+", help="stations to export (default: all)")
+    args = arg_parser.parse_args()
+
+    if args.command == "info":
+        with Archive(args.path) as archive:
+            print(f"{archive.rows} samples of {len(archive.directory)} station(s):")
+            for station_id, first_row, row_count in archive.directory.tolist():
+                days = archive.columns["day"][first_row:first_row + row_count].view("datetime64[D]")
+                print(f"  {station_id} {archive.names.get(station_id)}: {row_count} days, "
+                      f"{days[0] if row_count else '-'} to {days[-1] if row_count else '-'}")
+                del days
+    else:
+        db = DBOperations(args.db)
+        db.initialize_db()
+        if args.command == "export":
+            rows = export_archive(db, args.path, set(args.stations) if args.stations else None)
+            print(f"Exported {rows} samples to {args.path}.")
+        else:
+            rows = import_archive(args.path, db)
+            print(f"Imported {rows} new samples from {args.path}.")
@@ -0,0 +1,219 @@
+"""
+Module to backfill many stations at once.
+
+Month pages are downloaded concurrently on a thread pool, parsed on a process
+pool so HTML parsing uses every core, and written by a single BulkWriter.
+Each committed month is checkpointed, so an interrupted backfill resumes
+where it stopped when the same command is run again. Without an explicit
+start or end, a station's range is discovered by probing a few pages, and
+the probed months are saved without being requested again.
+
+Usage:
+    python backfill.py 27174 51097:2010-01 26953:2000-01:2009-12
+    python backfill.py 27174 --start 2000-01 --end 2024-12
+"""
+
+import argparse
+import os
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+from datetime import datetime
+from db_operations import DBOperations
+from db_writer import BulkWriter
+from http_session import HTTPSession
+from metrics import METRICS
+from page_cache import PageCache
+from resilience import AdaptiveLimiter, CircuitBreaker, RetryPolicy
+from scrape_weather import (WeatherScraper, RateLimiter, parse_month, month_range,
+                            DEFAULT_MAX_WORKERS, DEFAULT_REQUESTS_PER_SECOND)
+
+CHUNK_SIZE = 256  # work units held in memory at once
+
+
+def parse_year_month(text):
+    """Parse a 'YYYY-MM' string into a (year, month) tuple."""
+    year, month = map(int, text.split('-'))
+    if not 1 <= month <= 12:
+        raise ValueError(f"Month out of range: {text}")
+    return year, month
+
+
+def parse_station_spec(spec, default_start, default_end):
+    """
+    Parse 'STATION[:START[:END]]' into (station_id, start, end).
+    Bounds that are neither given nor defaulted are None, to be discovered.
+    """
+    parts = spec.split(':')
+    station_id = int(parts[0])
+    start = parse_year_month(parts[1]) if len(parts) > 1 and parts[1] else default_start
+    end = parse_year_month(parts[2]) if len(parts) > 2 and parts[2] else default_end
+    return station_id, start, end
+
+
+class Backfill:
+    """
+    Bulk backfill of (station, month) work units.
+    """
+    def __init__(self, db, max_workers=DEFAULT_MAX_WORKERS, parse_processes=None,
+                 requests_per_second=DEFAULT_REQUESTS_PER_SECOND, cache=None):
+        self.db = db
+        self.max_workers = max_workers
+        self.parse_processes = parse_processes or os.cpu_count()
+        self.session = HTTPSession()
+        self.cache = cache if cache is not None else PageCache()
+        self.rate_limiter = RateLimiter(requests_per_second)
+        self.retry = RetryPolicy()
+        self.breaker = CircuitBreaker()
+        self.limiter = AdaptiveLimiter(initial=max(1, max_workers // 2), maximum=max_workers)
+        self.scrapers = {}
+        self.failed = []
+
+    def scraper_for(self, station_id):
+        """
+        Return the scraper of a station; all of them share one session, cache,
+        rate limit, retry policy, circuit breaker and concurrency limit.
+        """
+        if station_id not in self.scrapers:
+            self.scrapers[station_id] = WeatherScraper(
+                max_workers=self.max_workers, session=self.session, cache=self.cache,
+                rate_limiter=self.rate_limiter, station_id=station_id, station_name=f"Station {station_id}",
+                retry=self.retry, breaker=self.breaker, limiter=self.limiter)
+        return self.scrapers[station_id]
+
+    def resolve(self, stations):
+        """
+        Fill in missing start or end months from each station's discovered range,
+        dropping stations without data.
+        """
+        resolved = []
+        for station_id, start, end in stations:
+            if start is None or end is None:
+                try:
+                    data_range = self.scraper_for(station_id).discover_range(self.db)
+                except Exception as e:
+                    print(f"Error discovering the range of station {station_id}: {e}")
+                    continue
+                if data_range is None:
+                    continue
+                start = start or data_range[0]
+                end = end or data_range[1]
+            resolved.append((station_id, start, end))
+        return resolved
+
+    def plan(self, stations):
+        """
+        Expand (station_id, start, end) ranges into the work units not yet checkpointed.
+        """
+        done = self.db.get_checkpoints()
+        units = []
+        for station_id, start, end in stations:
+            for year, month in month_range(start, end):
+                if (station_id, year, month) not in done:
+                    units.append((station_id, year, month))
+        return units
+
+    def fetch(self, unit):
+        """Download the raw page of one work unit, retrying transient errors."""
+        station_id, year, month = unit
+        scraper = self.scraper_for(station_id)
+        return self.retry.call(lambda: scraper.fetch_month_html(year, month),
+                               f"station {station_id} {year}-{month:02}")
+
+    def run(self, stations):
+        """
+        Backfill the given (station_id, start, end) ranges.
+        Returns the number of rows written.
+        """
+        known = self.db.fetch_stations()
+        for station_id, _, _ in stations:
+            if station_id not in known:
+                self.db.add_station(station_id, f"Station {station_id}")
+
+        units = self.plan(self.resolve(stations))
+        print(f"{len(units)} month(s) to backfill.")
+        now = datetime.now()
+        current = (now.year, now.month)
+        completed = 0
+
+        def save(writer, unit, weather):
+            station_id, year, month = unit
+            if (year, month) >= current:
+                writer.save_data(weather, station_id)  # still open, never checkpointed
+            else:
+                writer.save_month(weather, station_id, year, month)
+
+        with BulkWriter(self.db) as writer, \
+                ThreadPoolExecutor(max_workers=self.max_workers) as fetchers, \
+                ProcessPoolExecutor(max_workers=self.parse_processes) as parsers:
+            for offset in range(0, len(units), CHUNK_SIZE):
+                chunk = units[offset:offset + CHUNK_SIZE]
+                fetches = {}
+                for unit in chunk:
+                    weather = self.scraper_for(unit[0]).probed.pop(unit[1:], None)
+                    if weather is not None:  # already fetched while discovering the range
+                        save(writer, unit, weather)
+                        completed += 1
+                    else:
+                        fetches[fetchers.submit(self.fetch, unit)] = unit
+                parses = {}
+                for task in as_completed(fetches):
+                    unit = fetches[task]
+                    try:
+                        body = task.result()
+                    except Exception as e:
+                        print(f"Error fetching station {unit[0]} {unit[1]}-{unit[2]:02}: {e}")
+                        self.failed.append(unit)
+                        continue
+                    if body is not None:
+                        parses[parsers.submit(parse_month, body, unit[1], unit[2])] = unit
+
+                for task in as_completed(parses):
+                    unit = parses[task]
+                    try:
+                        weather = task.result()
+                    except Exception as e:
+                        print(f"Error parsing station {unit[0]} {unit[1]}-{unit[2]:02}: {e}")
+                        self.failed.append(unit)
+                        continue
+                    save(writer, unit, weather)
+                    completed += 1
+                print(f"Backfilled {completed}/{len(units)} month(s).")
+        return writer.rows_written
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Backfill daily weather data for many stations.")
+    arg_parser.add_argument("stations", nargs="+", help="STATION[:START[:END]], months as YYYY-MM")
+    arg_parser.add_argument("--start", type=parse_year_month, default=None,
+                            help="default first month (YYYY-MM; default: the station's earliest data)")
+    arg_parser.add_argument("--end", type=parse_year_month, default=None,
+                            help="default last month (YYYY-MM; default: the station's latest data)")
+    arg_parser.add_argument("--workers", type=int, default=DEFAULT_MAX_WORKERS,
+                            help="concurrent downloads")
+    arg_parser.add_argument("--processes", type=int, default=None,
+                            help="parser processes (default: one per core)")
+    arg_parser.add_argument("--rate", type=float, default=DEFAULT_REQUESTS_PER_SECOND,
+                            help="requests per second per host")
+    arg_parser.add_argument("--restart", action="store_true",
+                            help="ignore existing checkpoints for these stations")
+    arg_parser.add_argument("--metrics-json", metavar="PATH", help="write a JSON metrics summary when done")
+    arg_parser.add_argument("--metrics-prom", metavar="PATH",
+                            help="write metrics in the Prometheus text format when done")
+    args = arg_parser.parse_args()
+
+    db = DBOperations()
+    db.initialize_db()
+    station_ranges = [parse_station_spec(spec, args.start, args.end) for spec in args.stations]
+    if args.restart:
+        for station in station_ranges:
+            db.clear_checkpoints(station[0])
+
+    backfill = Backfill(db, max_workers=args.workers, parse_processes=args.processes,
+                        requests_per_second=args.rate)
+    rows = backfill.run(station_ranges)
+    print(f"Backfill finished: {rows} rows written.")
+    if backfill.failed:
+        print(f"{len(backfill.failed)} month(s) failed and stay pending; run the backfill again to retry them.")
+    if args.metrics_json:
+        METRICS.write_json(args.metrics_json)
+    if args.metrics_prom:
+        METRICS.write_prometheus(args.metrics_prom)
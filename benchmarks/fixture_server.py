@@ -0,0 +1,151 @@
+"""
+Module to serve synthetic daily data pages over HTTP for offline runs.
+
+The server answers the same URLs as climate.weather.gc.ca, after sleeping for
+`latency` seconds, and supports ETag revalidation so the page cache behaves as
+it does against the real site. The bulk CSV export of a station year is served
+as well. Months before `earliest_year` are served without any data rows (and
+years before it as blank CSV rows), and a fraction `error_rate` of requests
+fail with 503 to exercise retries.
+
+Usage:
+    python benchmarks/fixture_server.py --port 8000 --latency 0.1
+"""
+
+import argparse
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlparse
+from synthetic import month_page, year_csv, PAGE_PADDING
+
+DAILY_DATA_PATH = "/climate_data/daily_data_e.html"
+BULK_DATA_PATH = "/climate_data/bulk_data_e.html"
+
+
+class FixtureHandler(BaseHTTPRequestHandler):
+    """Request handler for FixtureServer; settings live on the server."""
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        """Serve a month page or a year of CSV, or 304 if the client's copy is current."""
+        url = urlparse(self.path)
+        if url.path not in (DAILY_DATA_PATH, BULK_DATA_PATH):
+            self.send_error(404)
+            return
+        bulk = url.path == BULK_DATA_PATH
+        try:
+            query = dict(parse_qsl(url.query))
+            station_id = int(query["stationID" if bulk else "StationID"])
+            year, month = int(query["Year"]), int(query["Month"])
+            if bulk and query.get("format") != "csv":
+                raise ValueError(query.get("format"))
+        except (KeyError, ValueError):
+            self.send_error(400)
+            return
+
+        server = self.server
+        if server.latency:
+            time.sleep(server.latency)
+        server.count_request()
+        if server.error_rate and random.random() < server.error_rate:
+            self.send_error(503)
+            return
+
+        etag = f'"{station_id}-{year}"' if bulk else f'"{station_id}-{year}-{month}"'
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        has_data = year >= server.earliest_year
+        if bulk:
+            body = year_csv(station_id, year, has_data)
+            content_type = "text/csv; charset=utf-8"
+        else:
+            body = month_page(station_id, year, month, has_data, server.padding)
+            content_type = "text/html; charset=utf-8"
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("ETag", etag)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        """Keep the benchmark output quiet."""
+
+
+class FixtureServer(ThreadingHTTPServer):
+    """
+    Local stand-in for the Environment Canada site, run on a background thread.
+    Use as a context manager; `base_url` is what WeatherScraper should request.
+    """
+    daemon_threads = True
+
+    def __init__(self, latency=0.0, earliest_year=1990, padding=PAGE_PADDING, port=0, error_rate=0.0):
+        super().__init__(("127.0.0.1", port), FixtureHandler)
+        self.latency = latency
+        self.error_rate = error_rate
+        self.earliest_year = earliest_year
+        self.padding = padding
+        self.requests = 0
+        self.lock = threading.Lock()
+        self.thread = None
+
+    @property
+    def base_url(self):
+        """URL of the daily data page on this server."""
+        return f"http://127.0.0.1:{self.server_address[1]}{DAILY_DATA_PATH}"
+
+    @property
+    def bulk_url(self):
+        """URL of the bulk CSV export on this server, for CSVWeatherScraper."""
+        return f"http://127.0.0.1:{self.server_address[1]}{BULK_DATA_PATH}"
+
+    def count_request(self):
+        """Count one served request."""
+        with self.lock:
+            self.requests += 1
+
+    def start(self):
+        """Serve requests on a daemon thread."""
+        self.thread = threading.Thread(target=self.serve_forever, name="fixture-server", daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        """Stop serving and release the socket."""
+        self.shutdown()
+        self.server_close()
+
+    def handle_error(self, request, client_address):
+        """Ignore clients that hang up mid-response, as the scraper does after the data table."""
+        if not isinstance(sys.exc_info()[1], (ConnectionResetError, BrokenPipeError)):
+            super().handle_error(request, client_address)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Serve synthetic daily data pages.")
+    arg_parser.add_argument("--port", type=int, default=8000)
+    arg_parser.add_argument("--latency", type=float, default=0.0, help="seconds to wait before each response")
+    arg_parser.add_argument("--earliest-year", type=int, default=1990, help="first year with data")
+    arg_parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered with 503")
+    args = arg_parser.parse_args()
+
+    server = FixtureServer(args.latency, args.earliest_year, port=args.port, error_rate=args.error_rate)
+    print(f"Serving synthetic pages at {server.base_url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
@@ -0,0 +1,294 @@
+"""
+Offline performance benchmarks for the weather app.
+
+Everything runs against synthetic data: pages come from the local fixture
+server and databases are created in a temporary directory, so no network
+access is needed and runs are comparable across commits.
+
+Usage:
+    python benchmarks/run_benchmarks.py --output results.json
+    python benchmarks/run_benchmarks.py --quick --compare results.json
+
+Results are written as JSON:
+    {"metadata": {"commit": ..., "python": ..., ...},
+     "results": [{"name": "parse_month", "params": {...}, "seconds": ..., ...}, ...]}
+where `seconds` is the best of the repeats and the other keys are throughputs.
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+import matplotlib
+matplotlib.use("Agg")
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+import dbcm
+from archive import Archive, export_archive
+from db_operations import DBOperations, group_by_month, month_bounds
+from plot_operations import PlotOperations
+from csv_source import parse_year, scraper_class
+from scrape_weather import parse_month
+from weather_processor import WeatherProcessor
+from fixture_server import FixtureServer
+from synthetic import month_page, populate, weather_dict, year_csv
+
+DEFAULT_SIZES = (10**3, 10**4, 10**5, 10**6, 10**7)
+QUICK_SIZES = (10**3, 10**4, 10**5)
+DEFAULT_MAX_DICT_ROWS = 10**6
+SLOWER_THRESHOLD = 1.10
+
+
+def measure(func, repeat=3):
+    """
+    Call `func` `repeat` times and return (best seconds, median seconds, last result).
+    """
+    times = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        times.append(time.perf_counter() - start)
+    return min(times), statistics.median(times), result
+
+
+def result(name, params, best, median, **metrics):
+    """Build one result record."""
+    return {"name": name, "params": params, "seconds": best, "median_seconds": median, **metrics}
+
+
+@contextlib.contextmanager
+def temp_db(directory, name):
+    """Create an initialized database in `directory`, closing its pooled connections afterwards."""
+    db = DBOperations(os.path.join(directory, name))
+    with contextlib.redirect_stdout(io.StringIO()):
+        db.initialize_db()
+    try:
+        yield db
+    finally:
+        dbcm.close_connections(db.db_name)
+
+
+def bench_parse(repeat):
+    """Parse throughput of parse_month over a year of synthetic pages."""
+    pages = [(month_page(27174, 2023, month), 2023, month) for month in range(1, 13)]
+    total_bytes = sum(len(body) for body, _, _ in pages)
+
+    def parse_all():
+        return sum(len(parse_month(body, year, month)) for body, year, month in pages)
+
+    best, median, days = measure(parse_all, repeat)
+    results = [result("parse_month", {"pages": len(pages)}, best, median,
+                      pages_per_second=len(pages) / best, mb_per_second=total_bytes / best / 1e6,
+                      days_per_second=days / best)]
+
+    body = year_csv(27174, 2023)
+    best, median, days = measure(lambda: len(parse_year(body)), repeat)
+    results.append(result("parse_year_csv", {"years": 1}, best, median,
+                          mb_per_second=len(body) / best / 1e6, days_per_second=days / best))
+    return results
+
+
+def bench_scrape_backwards(directory, latency, workers, sources, years=5):
+    """
+    End-to-end scrape_backwards wall time against the fixture server, for a
+    station with `years` years of data up to the current month, with caching
+    off, for each of `sources`. Includes discovering the station's range.
+    """
+    results = []
+    now = datetime.now()
+    with FixtureServer(latency, earliest_year=now.year - years + 1) as server:
+        for source in sources:
+            with temp_db(directory, f"scrape-{source}.sqlite") as db:
+                scraper = scraper_class(source)(max_workers=workers, requests_per_second=0, cache=False)
+                scraper.base_url = server.base_url
+                scraper.bulk_url = server.bulk_url
+                served = server.requests
+                with contextlib.redirect_stdout(io.StringIO()):
+                    best, median, counts = measure(
+                        lambda: scraper.scrape_backwards(now.year, now.month, db), repeat=1)
+                scraper.session.close()
+                days = sum(count or 0 for count in counts.values())
+                results.append(result("scrape_backwards",
+                                      {"source": source, "workers": workers,
+                                       "latency": latency, "years": years},
+                                      best, median, months=len(counts), days=days,
+                                      months_per_second=len(counts) / best,
+                                      requests=server.requests - served))
+    return results
+
+
+def bench_save_data(directory, sizes, repeat):
+    """
+    Insert rate of save_data for fresh days, and for a batch that is already
+    stored (every row ignored).
+    """
+    results = []
+    for n_days in sizes:
+        weather = weather_dict(1, 1750, n_days)
+        new_times = []
+        for attempt in range(repeat):
+            with temp_db(directory, f"save-{n_days}-{attempt}.sqlite") as db:
+                with contextlib.redirect_stdout(io.StringIO()):
+                    best, _, _ = measure(lambda: db.save_data(weather, 1), repeat=1)
+                    new_times.append(best)
+                    if attempt == repeat - 1:
+                        dup_best, dup_median, _ = measure(lambda: db.save_data(weather, 1), repeat)
+        best = min(new_times)
+        results.append(result("save_data", {"rows": n_days}, best, statistics.median(new_times),
+                              rows_per_second=n_days / best))
+        results.append(result("save_data_existing", {"rows": n_days}, dup_best, dup_median,
+                              rows_per_second=n_days / dup_best))
+    return results
+
+
+def bench_fetch(directory, sizes, repeat, max_dict_rows):
+    """
+    fetch_data, fetch_columns and organize_data_for_plotting over the whole
+    table at each size. Sizes above one station's worth of days are spread
+    over several stations; fetch_data is skipped above `max_dict_rows` because
+    its list of dictionaries would not fit in memory. The table is also
+    exported to an archive, which is then opened and read back station by station.
+    """
+    results = []
+    processor = WeatherProcessor()
+    for n_rows in sizes:
+        with temp_db(directory, f"fetch-{n_rows}.sqlite") as db:
+            stations = populate(db, n_rows)
+            params = {"rows": n_rows, "stations": stations}
+            if n_rows <= max_dict_rows:
+                best, median, rows = measure(db.fetch_data, repeat)
+                results.append(result("fetch_data", params, best, median, rows_per_second=len(rows) / best))
+                del rows
+            else:
+                results.append({"name": "fetch_data", "params": params, "skipped": "above --max-dict-rows"})
+            best, median, columns = measure(db.fetch_columns, repeat)
+            results.append(result("fetch_columns", params, best, median, rows_per_second=n_rows / best))
+            best, median, _ = measure(lambda: processor.organize_data_for_plotting(columns), repeat)
+            results.append(result("organize_data_for_plotting", params, best, median,
+                                  rows_per_second=n_rows / best))
+            del columns
+
+            archive_path = os.path.join(directory, f"fetch-{n_rows}.wxa")
+            best, median, _ = measure(lambda: export_archive(db, archive_path), 1)
+            results.append(result("export_archive", params, best, median, rows_per_second=n_rows / best))
+
+            def read_archive():
+                with Archive(archive_path) as archive:
+                    total = 0.0
+                    for station_id in archive.stations():
+                        total += float(archive.fetch_columns(station_id)["avg_temp"].sum())
+                    return total
+
+            best, median, _ = measure(read_archive, repeat)
+            results.append(result("read_archive", params, best, median, rows_per_second=n_rows / best))
+            os.remove(archive_path)
+            os.remove(db.db_name)
+    return results
+
+
+def bench_plots(directory, repeat):
+    """Time to build and rasterize the line plot and the summary box plot with Agg."""
+    results = []
+    with temp_db(directory, "plots.sqlite") as db:
+        with contextlib.redirect_stdout(io.StringIO()):
+            db.save_data(weather_dict(1, 2019, 5 * 365), 1)
+        columns = db.fetch_columns(*month_bounds(2023, 1), 1)
+        month_data = group_by_month(columns["date"], columns["avg_temp"])
+        summary = db.fetch_climate_summary(1, 2019, 2023)
+
+    def render(make_figure):
+        fig = make_figure()
+        FigureCanvasAgg(fig)
+        fig.savefig(io.BytesIO(), format="png")
+
+    for name, make_figure in (
+            ("render_lineplot", lambda: PlotOperations(month_data).lineplot_figure(2023, 1)),
+            ("render_boxplot_summary", lambda: PlotOperations(summary).boxplot_summary_figure(2019, 2023))):
+        best, median, _ = measure(lambda: render(make_figure), repeat)
+        results.append(result(name, {"format": "png"}, best, median, charts_per_second=1 / best))
+    return results
+
+
+def git_commit():
+    """Return the current commit of the repository, or None outside git."""
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=REPO_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline):
+    """Print the change in best time of every benchmark also present in `baseline`."""
+    previous = {(entry["name"], json.dumps(entry["params"], sort_keys=True)): entry
+                for entry in baseline["results"] if "seconds" in entry}
+    print(f"Compared with {baseline['metadata'].get('commit') or 'baseline'}:")
+    for entry in results["results"]:
+        old = previous.get((entry["name"], json.dumps(entry["params"], sort_keys=True)))
+        if old is None or "seconds" not in entry:
+            continue
+        ratio = entry["seconds"] / old["seconds"]
+        flag = "  SLOWER" if ratio > SLOWER_THRESHOLD else ""
+        print(f"  {entry['name']} {entry['params']}: {old['seconds']:.4f}s -> {entry['seconds']:.4f}s "
+              f"({ratio:.2f}x){flag}")
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Run the offline benchmarks.")
+    arg_parser.add_argument("--output", help="write the JSON results to this file instead of stdout")
+    arg_parser.add_argument("--quick", action="store_true", help="smaller sizes and fewer repeats")
+    arg_parser.add_argument("--sizes", type=int, nargs="+", help="row counts for the fetch benchmarks")
+    arg_parser.add_argument("--max-dict-rows", type=int, default=DEFAULT_MAX_DICT_ROWS,
+                            help="largest size to run fetch_data at")
+    arg_parser.add_argument("--latency", type=float, default=0.05, help="fixture server latency in seconds")
+    arg_parser.add_argument("--workers", type=int, default=8, help="scraper workers")
+    arg_parser.add_argument("--repeat", type=int, default=None, help="repeats per benchmark")
+    arg_parser.add_argument("--compare", help="baseline JSON results to compare against")
+    args = arg_parser.parse_args()
+
+    repeat = args.repeat or (1 if args.quick else 3)
+    sizes = args.sizes or (QUICK_SIZES if args.quick else DEFAULT_SIZES)
+    save_sizes = [size for size in sizes if size <= 10**5]
+
+    with tempfile.TemporaryDirectory(prefix="weather-bench-") as directory:
+        results = []
+        results += bench_parse(repeat)
+        results += bench_scrape_backwards(directory, args.latency, args.workers, ("html", "csv"))
+        results += bench_save_data(directory, save_sizes, repeat)
+        results += bench_fetch(directory, sizes, repeat, args.max_dict_rows)
+        results += bench_plots(directory, repeat)
+
+    report = {
+        "metadata": {
+            "commit": git_commit(),
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "quick": args.quick,
+        },
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"Wrote {len(results)} results to {args.output}")
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            compare(report, json.load(f))
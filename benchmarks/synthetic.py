@@ -0,0 +1,165 @@
+"""
+Module to generate synthetic Environment Canada data for the benchmarks.
+
+Pages follow the layout of the real daily data page closely enough for
+MonthParser: a pager with the "Previous Month" link, one table row per day
+with the day in a <th> and eleven <td> columns, missing values flagged with
+"M", and the Sum/Avg/Xtrm footer rows. Output is deterministic for a given
+station, year and month.
+"""
+
+import calendar
+import math
+import random
+
+PAGE_PADDING = 60000  # bytes of navigation and footer markup around the table
+DAYS_PER_STATION = 36500  # keep synthetic dates inside the range of datetime.date
+
+
+def seasonal_mean(day_of_year):
+    """Mean temperature of a prairie-like climate for a day of the year."""
+    return 2.5 - 20.0 * math.cos(2 * math.pi * (day_of_year - 15) / 365.25)
+
+
+def month_days(station_id, year, month, missing_rate=0.03):
+    """
+    Return [(day, max, min, mean)] for a month, with None for missing values.
+    """
+    rng = random.Random(station_id * 100000 + year * 100 + month)
+    first = sum(calendar.monthrange(year, m)[1] for m in range(1, month))
+    days = []
+    for day in range(1, calendar.monthrange(year, month)[1] + 1):
+        mean = seasonal_mean(first + day) + rng.gauss(0, 5)
+        spread = abs(rng.gauss(10, 3))
+        values = [round(mean + spread / 2, 1), round(mean - spread / 2, 1), round(mean, 1)]
+        values = [None if rng.random() < missing_rate else value for value in values]
+        days.append((day, *values))
+    return days
+
+
+def cell(value):
+    """Format a temperature cell the way the real page does."""
+    if value is None:
+        return '<td><abbr title="Missing">M</abbr></td>'
+    return f"<td>{value:.1f}</td>"
+
+
+def month_page(station_id, year, month, has_data=True, padding=PAGE_PADDING):
+    """Return the HTML of the daily data page of a month as bytes."""
+    rows = []
+    if has_data:
+        month_name = calendar.month_name[month]
+        for day, max_temp, min_temp, mean_temp in month_days(station_id, year, month):
+            rows.append(
+                f'<tr><th scope="row"><abbr title="{month_name} {day}, {year}">{day:02}</abbr></th>'
+                f"{cell(max_temp)}{cell(min_temp)}{cell(mean_temp)}"
+                "<td>4.2</td><td>0.0</td><td>0.0</td><td>0.0</td><td>0.0</td><td>12</td>"
+                "<td>27</td><td>46</td></tr>")
+        for label in ("Sum", "Avg", "Xtrm"):
+            rows.append(f'<tr class="active"><th scope="row">{label}</th>' + "<td>&nbsp;</td>" * 11 + "</tr>")
+
+    navigation = '<li><a href="#">Link</a></li>' * (padding // 60)
+    pager = (f'<ul class="pager"><li class="previous"><a href="?Year={year}&amp;Month={month}">'
+             '&lt; Previous Month</a></li><li class="next"><a href="#">Next Month &gt;</a></li></ul>')
+    page = (
+        "<!DOCTYPE html><html lang=\"en\"><head><title>Daily Data Report</title></head><body>"
+        f'<nav><ul class="menu">{navigation}</ul></nav><main>{pager}'
+        '<table class="table table-striped"><caption>Daily Data Report</caption>'
+        "<thead><tr><th>DAY</th><th>Max Temp</th><th>Min Temp</th><th>Mean Temp</th>"
+        "<th>Heat Deg Days</th><th>Cool Deg Days</th><th>Total Rain</th><th>Total Snow</th>"
+        "<th>Total Precip</th><th>Snow on Grnd</th><th>Dir of Max Gust</th>"
+        f"<th>Spd of Max Gust</th></tr></thead><tbody>{''.join(rows)}</tbody></table>"
+        f"{pager}</main><footer>{'<p>Legend and notes.</p>' * (padding // 120)}</footer>"
+        "</body></html>"
+    )
+    return page.encode("utf-8")
+
+
+CSV_HEADER = ('"Longitude (x)","Latitude (y)","Station Name","Climate ID","Date/Time","Year","Month","Day",'
+              '"Data Quality","Max Temp (°C)","Max Temp Flag","Min Temp (°C)","Min Temp Flag",'
+              '"Mean Temp (°C)","Mean Temp Flag","Heat Deg Days (°C)","Heat Deg Days Flag",'
+              '"Cool Deg Days (°C)","Cool Deg Days Flag","Total Rain (mm)","Total Rain Flag",'
+              '"Total Snow (cm)","Total Snow Flag","Total Precip (mm)","Total Precip Flag",'
+              '"Snow on Grnd (cm)","Snow on Grnd Flag","Dir of Max Gust (10s deg)","Dir of Max Gust Flag",'
+              '"Spd of Max Gust (km/h)","Spd of Max Gust Flag"')
+
+
+def csv_value(value):
+    """Format a temperature and its flag the way the bulk CSV export does."""
+    if value is None:
+        return '"","M"'
+    return f'"{value:.1f}",""'
+
+
+def year_csv(station_id, year, has_data=True):
+    """
+    Return the bulk daily CSV export of a station year as bytes: UTF-8 with a
+    byte order mark, and a row for every day of the year, blank without data.
+    """
+    lines = [CSV_HEADER]
+    prefix = f'"-97.24","49.92","SYNTHETIC {station_id}","{5000000 + station_id}"'
+    for month in range(1, 13):
+        if has_data:
+            days = month_days(station_id, year, month)
+        else:
+            days = [(day, None, None, None) for day in range(1, calendar.monthrange(year, month)[1] + 1)]
+        for day, max_temp, min_temp, mean_temp in days:
+            if has_data:
+                temps = f"{csv_value(max_temp)},{csv_value(min_temp)},{csv_value(mean_temp)}"
+                rest = '"4.2","","0.0","","0.0","","0.0","","0.0","","12","","27","","46",""'
+            else:
+                temps = '"","","","","",""'
+                rest = '"","",' * 7 + '"",""'
+            lines.append(f'{prefix},"{year}-{month:02}-{day:02}","{year}","{month:02}","{day:02}","",'
+                         f"{temps},{rest}")
+    return ("\ufeff" + "\r\n".join(lines) + "\r\n").encode("utf-8")
+
+
+def weather_dict(station_id, start_year, n_days):
+    """
+    Return a scraper-style {date: {"Max", "Min", "Mean"}} dictionary of
+    `n_days` consecutive complete days starting on January 1 of `start_year`.
+    """
+    weather = {}
+    year, month = start_year, 1
+    while len(weather) < n_days:
+        for day, max_temp, min_temp, mean_temp in month_days(station_id, year, month, missing_rate=0):
+            if len(weather) == n_days:
+                break
+            weather[f"{year}-{month:02}-{day:02}"] = {"Max": max_temp, "Min": min_temp, "Mean": mean_temp}
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return weather
+
+
+def sample_rows(n_rows, first_day=-25567):
+    """
+    Yield `n_rows` (station_id, day, min, max, mean) sample rows, spread over
+    as many stations as needed to keep every station within DAYS_PER_STATION.
+    `first_day` defaults to 1900-01-01 in days since 1970-01-01.
+    """
+    rng = random.Random(n_rows)
+    for index in range(n_rows):
+        station_id, offset = divmod(index, DAYS_PER_STATION)
+        mean = seasonal_mean(offset % 365) + rng.gauss(0, 5)
+        yield (station_id + 1, first_day + offset, round(mean - 5, 1), round(mean + 5, 1), round(mean, 1))
+
+
+def populate(db, n_rows, batch_size=100000):
+    """
+    Fill an initialized database with `n_rows` synthetic samples as fast as
+    possible. Rows go straight into the samples table, so monthly_stats is not
+    maintained; use this only to set up read benchmarks.
+    """
+    rows = sample_rows(n_rows)
+    n_stations = (n_rows + DAYS_PER_STATION - 1) // DAYS_PER_STATION
+    with db.connect() as cursor:
+        cursor.execute("BEGIN")
+        cursor.executemany("INSERT OR IGNORE INTO stations (station_id, name) VALUES (?, ?)",
+                           [(station_id, f"Synthetic {station_id}") for station_id in range(1, n_stations + 1)])
+        while True:
+            batch = [row for _, row in zip(range(batch_size), rows)]
+            if not batch:
+                break
+            cursor.executemany("""INSERT OR IGNORE INTO samples (station_id, day, min_temp, max_temp, avg_temp)
+                                  VALUES (?, ?, ?, ?, ?)""", batch)
+    return n_stations
@@ -0,0 +1,237 @@
+"""
+Module to scrape daily data from the bulk CSV export instead of month pages.
+
+Environment Canada publishes the daily data of a whole station year as one
+CSV file, so a station's history takes one request per year instead of one
+per month, and parsing it is a plain csv.reader pass instead of HTML parsing.
+CSVWeatherScraper is a drop-in replacement for WeatherScraper: it fetches,
+retries, rate limits and saves the same way, and hands each month of a year to
+the same save_data pipeline.
+
+The source is picked per run with `scraper_class("html")` or
+`scraper_class("csv")`, e.g. `python weather_processor.py --source csv`.
+"""
+
+import codecs
+import csv
+import threading
+import time
+from metrics import METRICS
+from resilience import HTTPStatusError, parse_retry_after
+from scrape_weather import WeatherScraper
+
+BULK_URL = "http://climate.weather.gc.ca/climate_data/bulk_data_e.html"
+SOURCES = ("html", "csv")
+
+DATE_COLUMN = "Date/Time"
+TEMPERATURE_COLUMNS = {"Max": "Max Temp", "Min": "Min Temp", "Mean": "Mean Temp"}
+
+
+class YearParser:
+    """
+    Incremental parser of a bulk daily CSV file, fed the raw bytes as they
+    download. Days whose three temperatures are all blank (such as the rest of
+    the current year) are skipped; a blank value of a listed day becomes None.
+    """
+    def __init__(self):
+        self.decoder = codecs.getincrementaldecoder("utf-8-sig")()
+        self.pending = ""  # the last, possibly incomplete, line
+        self.columns = None  # (date, max, min, mean) column positions, from the header
+        self.weather = {}  # date -> {"Max", "Min", "Mean"}
+
+    def feed_bytes(self, chunk):
+        """Decode and parse the complete lines of the next chunk. Always returns True."""
+        lines = (self.pending + self.decoder.decode(chunk)).split("\n")
+        self.pending = lines.pop()
+        self.parse_lines(lines)
+        return True
+
+    def finish(self):
+        """Parse whatever is still buffered after the last chunk."""
+        self.parse_lines((self.pending + self.decoder.decode(b"", final=True)).splitlines())
+        self.pending = ""
+        return self.weather
+
+    def parse_lines(self, lines):
+        """Parse complete CSV lines, reading the column positions from the header."""
+        for row in csv.reader(lines):
+            if not row:
+                continue
+            if self.columns is None:
+                self.columns = self.find_columns(row)
+                continue
+            try:
+                date = row[self.columns[0]]
+                values = [row[index].strip() for index in self.columns[1:]]
+            except IndexError:
+                continue  # a truncated row
+            if not any(values):
+                continue
+            temps = []
+            for value in values:
+                try:
+                    temps.append(float(value))
+                except ValueError:
+                    temps.append(None)  # missing or invalid data
+            self.weather[date] = {"Max": temps[0], "Min": temps[1], "Mean": temps[2]}
+
+    @staticmethod
+    def find_columns(header):
+        """Return the positions of the date and temperature columns of a header row."""
+        names = [name.strip() for name in header]
+        try:
+            columns = [names.index(DATE_COLUMN)]
+        except ValueError:
+            raise ValueError(f"Not a daily data CSV file: no {DATE_COLUMN!r} column") from None
+        for label in TEMPERATURE_COLUMNS.values():
+            matches = [index for index, name in enumerate(names)
+                       if name.startswith(label) and "Flag" not in name]
+            if not matches:
+                raise ValueError(f"Not a daily data CSV file: no {label!r} column")
+            columns.append(matches[0])
+        return columns
+
+
+def parse_year(body):
+    """
+    Parse a raw bulk CSV file into a dictionary of days.
+    A plain function so it can run in a process pool.
+    """
+    parser = YearParser()
+    parser.feed_bytes(body)
+    return parser.finish()
+
+
+def split_by_month(weather):
+    """Group a {date: temps} dictionary into {month: {date: temps}}."""
+    months = {}
+    for date, temps in weather.items():
+        months.setdefault(int(date[5:7]), {})[date] = temps
+    return months
+
+
+class CSVWeatherScraper(WeatherScraper):
+    """
+    WeatherScraper that downloads a year of daily data per request from the
+    bulk CSV export. The months of a year are scraped by the same worker, which
+    downloads the year once; the page cache is not used.
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.bulk_url = BULK_URL
+        self.years = {}  # year -> {month: weather} not yet handed out, or the error it failed with
+        self.years_lock = threading.Lock()
+        self.year_locks = {}  # year -> lock held while the year downloads
+
+    def year_url(self, year):
+        """Build the bulk CSV URL of a station year."""
+        return (f"{self.bulk_url}?format=csv&stationID={self.station_id}&Year={year}"
+                f"&Month=1&Day=1&timeframe=2&submit=Download+Data")
+
+    def fetch_year_csv(self, year, on_chunk=None):
+        """
+        Fetch the raw CSV file of a year, passing it to `on_chunk` while it
+        downloads. Returns None in offline mode, where there is nothing cached.
+        """
+        if self.offline:
+            return None
+        url = self.year_url(year)
+        response = self.request(url, on_chunk=on_chunk)
+        if response.status != 200:
+            raise HTTPStatusError(response.status, url, parse_retry_after(response.headers.get("Retry-After")))
+        return response.body
+
+    def scrape_year(self, year):
+        """
+        Download and parse the daily data of a year.
+        Transient errors are retried; if the year still fails, the error is raised.
+        Returns a dictionary mapping each month with data to its days.
+        """
+        if self.verbose:
+            print(f"Scraping data for {year}...")
+        started = time.perf_counter()
+
+        def attempt():
+            parser = YearParser()
+            parse_seconds = [0.0]
+
+            def parse_chunk(chunk):
+                chunk_started = time.perf_counter()
+                parser.feed_bytes(chunk)
+                parse_seconds[0] += time.perf_counter() - chunk_started
+                return True
+
+            body = self.fetch_year_csv(year, parse_chunk)
+            if body is not None:
+                parser.finish()
+            return body, parser, parse_seconds[0]
+
+        try:
+            body, parser, parse_seconds = self.retry.call(attempt, str(year))
+        except Exception as e:
+            METRICS.increment("years_failed_total")
+            print(f"Error fetching data for {year}: {e}")
+            raise
+        if body is None:
+            print(f"The CSV source cannot be used offline, skipping {year}.")
+            return {}
+        finished = time.perf_counter()
+
+        METRICS.observe("fetch_seconds", finished - started - parse_seconds)
+        METRICS.observe("parse_seconds", parse_seconds)
+        METRICS.increment("rows_parsed_total", len(parser.weather))
+        METRICS.record("year", station_id=self.station_id, year=year,
+                       fetch_seconds=finished - started - parse_seconds, bytes=len(body),
+                       parse_seconds=parse_seconds, rows_parsed=len(parser.weather))
+        return split_by_month(parser.weather)
+
+    def scrape_all_days(self, year, month):
+        """
+        Return the days of a month, downloading its year on first use. The other
+        months of the year are kept until they are asked for, so a year is
+        downloaded once however its months are requested. A year that failed is
+        remembered too, and its error raised again for its other months.
+        """
+        with self.years_lock:
+            year_lock = self.year_locks.setdefault(year, threading.Lock())
+        with year_lock:
+            if year not in self.years:
+                try:
+                    self.years[year] = self.scrape_year(year)
+                except Exception as e:
+                    self.years[year] = e
+                    raise
+            if isinstance(self.years[year], Exception):
+                raise self.years[year]
+            return self.years[year].pop(month, {})
+
+    def month_groups(self, months):
+        """Group consecutive months of the same year, so one worker downloads each year."""
+        groups = []
+        for month in months:
+            if groups and groups[-1][0][0] == month[0]:
+                groups[-1].append(month)
+            else:
+                groups.append([month])
+        return groups
+
+    def scrape_months(self, months, db=None, progress=None, cancel_event=None):
+        """
+        Scrape and save a list of (year, month) pairs, one request per year.
+        Downloaded months that were not asked for are dropped afterwards.
+        """
+        try:
+            return super().scrape_months(months, db, progress, cancel_event)
+        finally:
+            with self.years_lock:
+                self.years.clear()
+                self.year_locks.clear()
+
+
+def scraper_class(source):
+    """Return the scraper class of a source, "html" (month pages) or "csv" (bulk CSV)."""
+    if source == "csv":
+        return CSVWeatherScraper
+    if source == "html":
+        return WeatherScraper
+    raise ValueError(f"Unknown source: {source}")
@@ -2,87 +2,686 @@
 Module to handle database operations.
 """
 
+import calendar
+import sqlite3
+import threading
+import time
+from datetime import date, datetime, timedelta
 from dbcm import DBCM
+from metrics import METRICS
+from monthly_stats import MonthStats
 
 DB_NAME = "weather.sqlite"
+DEFAULT_STATION_ID = 27174
+DEFAULT_STATION_NAME = "Winnipeg, MB"
+EPOCH = date(1970, 1, 1)
+SAMPLE_FIELDS = [("station_id", "i8"), ("day", "i8"), ("min_temp", "f8"), ("max_temp", "f8"),
+                 ("avg_temp", "f8")]
+
+
+def to_day_number(value):
+    """Convert a 'YYYY-MM-DD' string or a date to the number of days since 1970-01-01."""
+    if isinstance(value, str):
+        value = date.fromisoformat(value)
+    return (value - EPOCH).days
+
+
+def from_day_number(day):
+    """Convert a day number back to a 'YYYY-MM-DD' string."""
+    return (EPOCH + timedelta(days=day)).isoformat()
+
+
+def month_bounds(year, month):
+    """Return the first and last date of a month as 'YYYY-MM-DD' strings."""
+    last_day = calendar.monthrange(year, month)[1]
+    return f"{year}-{month:02}-01", f"{year}-{month:02}-{last_day:02}"
+
+
+def group_by_month(dates, values):
+    """
+    Group values by calendar month without building per-row Python objects.
+    `dates` must be sorted datetime64[D]. Returns {year: {month: ndarray}}.
+    """
+    import numpy as np  # deferred so updates don't pay for NumPy at startup
+
+    grouped = {}
+    if len(dates) == 0:
+        return grouped
+    month_index = dates.astype("datetime64[M]").astype(np.int64)  # months since 1970-01
+    starts = np.flatnonzero(np.diff(month_index, prepend=month_index[0] - 1))
+    for index, chunk in zip(month_index[starts], np.split(values, starts[1:])):
+        year, month = divmod(int(index), 12)
+        grouped.setdefault(year + 1970, {})[month + 1] = chunk
+    return grouped
+
+
 class DBOperations:
     """
     Class to handle database operations.
+    The keyword arguments are applied as pragmas once per pooled connection;
+    WAL lets readers keep working while a writer commits, and `cache_size`
+    (negative means KiB), `mmap_size` (bytes) and `temp_store` tune reads.
     """
-    def __init__(self, db_name=DB_NAME):
+    def __init__(self, db_name=DB_NAME, journal_mode="WAL", synchronous="NORMAL",
+                 cache_size=-20000, mmap_size=256 * 1024 * 1024, temp_store="MEMORY"):
         """Initialize the DBOperations class with the database name."""
         self.db_name = db_name
+        self.pragmas = {"journal_mode": journal_mode, "synchronous": synchronous,
+                        "cache_size": cache_size, "mmap_size": mmap_size, "temp_store": temp_store}
+        self.version_connection = None  # opened by data_generation, never used to write
+        self.version_lock = threading.Lock()
+
+    def connect(self):
+        """Return a connection manager for this thread's pooled connection."""
+        return DBCM(self.db_name, self.pragmas)
+
+    def data_generation(self):
+        """
+        Return a value that changes whenever the data changes, so callers can
+        tell whether cached results are still valid. It is the data_version of
+        a dedicated connection that never writes, so commits from any other
+        connection count, including those of other processes.
+        """
+        with self.version_lock:
+            if self.version_connection is None:
+                self.version_connection = sqlite3.connect(self.db_name, check_same_thread=False)
+            return self.version_connection.execute("PRAGMA data_version").fetchone()[0]
 
     def initialize_db(self):
         """
-        Initialize the database and create the samples table if it doesn't exist.
+        Initialize the database and create the tables if they don't exist.
+        A database still using the single-station layout is migrated in place.
+
+        Samples are keyed by (station_id, day), where day is the number of days
+        since 1970-01-01. The table is WITHOUT ROWID, so the primary key is a
+        clustered covering index and per-station range scans read contiguous
+        pages; samples_day serves date-range queries across all stations.
         """
         try:
-            with DBCM(self.db_name) as cursor:
+            with self.connect() as cursor:
                 print("Opening database...")
+                cursor.execute("BEGIN")
+                cursor.execute("PRAGMA table_info(samples)")
+                columns = [row[1] for row in cursor.fetchall()]
+                if "date" in columns:
+                    cursor.execute("ALTER TABLE samples RENAME TO samples_v1")
+                    cursor.execute("DROP INDEX IF EXISTS samples_location_date")
+
+                cursor.execute("""CREATE TABLE IF NOT EXISTS stations (
+                                    station_id INTEGER PRIMARY KEY NOT NULL,
+                                    name TEXT NOT NULL
+                                );""")
                 cursor.execute("""CREATE TABLE IF NOT EXISTS samples (
-                                    id INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL,
-                                    date TEXT NOT NULL UNIQUE,
-                                    location TEXT NOT NULL,
+                                    station_id INTEGER NOT NULL REFERENCES stations (station_id),
+                                    day INTEGER NOT NULL,
                                     min_temp REAL NOT NULL,
                                     max_temp REAL NOT NULL,
-                                    avg_temp REAL NOT NULL
+                                    avg_temp REAL NOT NULL,
+                                    PRIMARY KEY (station_id, day)
+                                ) WITHOUT ROWID;""")
+                cursor.execute("""CREATE INDEX IF NOT EXISTS samples_day
+                                  ON samples (day);""")
+                cursor.execute("""CREATE TABLE IF NOT EXISTS sync_state (
+                                    station_id INTEGER PRIMARY KEY NOT NULL,
+                                    last_year INTEGER NOT NULL,
+                                    last_month INTEGER NOT NULL,
+                                    updated_at TEXT NOT NULL
+                                );""")
+
+                cursor.execute("""CREATE TABLE IF NOT EXISTS month_coverage (
+                                    station_id INTEGER NOT NULL,
+                                    year INTEGER NOT NULL,
+                                    month INTEGER NOT NULL,
+                                    present INTEGER NOT NULL,
+                                    nulls INTEGER NOT NULL,
+                                    repair_attempts INTEGER NOT NULL DEFAULT 0,
+                                    PRIMARY KEY (station_id, year, month)
+                                ) WITHOUT ROWID;""")
+
+                cursor.execute("""CREATE TABLE IF NOT EXISTS station_ranges (
+                                    station_id INTEGER PRIMARY KEY NOT NULL,
+                                    first_year INTEGER NOT NULL,
+                                    first_month INTEGER NOT NULL,
+                                    last_year INTEGER NOT NULL,
+                                    last_month INTEGER NOT NULL,
+                                    checked_at TEXT NOT NULL
                                 );""")
+
+                cursor.execute("""CREATE TABLE IF NOT EXISTS backfill_checkpoints (
+                                    station_id INTEGER NOT NULL,
+                                    year INTEGER NOT NULL,
+                                    month INTEGER NOT NULL,
+                                    days INTEGER NOT NULL,
+                                    completed_at TEXT NOT NULL,
+                                    PRIMARY KEY (station_id, year, month)
+                                ) WITHOUT ROWID;""")
+
+                cursor.execute("""CREATE TABLE IF NOT EXISTS monthly_stats (
+                                    station_id INTEGER NOT NULL,
+                                    year INTEGER NOT NULL,
+                                    month INTEGER NOT NULL,
+                                    count INTEGER NOT NULL,
+                                    sum REAL NOT NULL,
+                                    sum_sq REAL NOT NULL,
+                                    min REAL NOT NULL,
+                                    max REAL NOT NULL,
+                                    histogram BLOB NOT NULL,
+                                    PRIMARY KEY (station_id, year, month)
+                                ) WITHOUT ROWID;""")
+
+                if "date" in columns:
+                    self.migrate_single_station(cursor)
+                cursor.execute("SELECT EXISTS (SELECT 1 FROM monthly_stats)")
+                has_stats = cursor.fetchone()[0]
+                cursor.execute("SELECT EXISTS (SELECT 1 FROM month_coverage)")
+                has_coverage = cursor.fetchone()[0]
+                cursor.execute("SELECT EXISTS (SELECT 1 FROM samples)")
+                if cursor.fetchone()[0]:
+                    if not has_stats:
+                        self.rebuild_monthly_stats(cursor)
+                    if not has_coverage:
+                        self.rebuild_coverage(cursor)
                 print("Database initialized successfully.")
         except Exception as e:
             print("Error initializing the database:", e)
 
+    def migrate_single_station(self, cursor):
+        """
+        Copy rows from the old single-station table (renamed to samples_v1) into
+        the keyed samples table. The old scraper only ever fetched the default
+        station, so every legacy row belongs to it.
+        """
+        cursor.execute("INSERT OR IGNORE INTO stations (station_id, name) VALUES (?, ?)",
+                       (DEFAULT_STATION_ID, DEFAULT_STATION_NAME))
+        cursor.execute("""INSERT OR IGNORE INTO samples (station_id, day, min_temp, max_temp, avg_temp)
+                          SELECT ?, CAST(julianday(date) - 2440587.5 AS INTEGER), min_temp, max_temp, avg_temp
+                          FROM samples_v1
+                          WHERE julianday(date) IS NOT NULL""", (DEFAULT_STATION_ID,))
+        print(f"Migrated {cursor.rowcount} rows to the multi-station layout.")
+        cursor.execute("DROP TABLE samples_v1")
+
+    def add_station(self, station_id, name):
+        """
+        Register a station, or update its name if it already exists.
+        """
+        try:
+            with self.connect() as cursor:
+                cursor.execute("""INSERT INTO stations (station_id, name) VALUES (?, ?)
+                                  ON CONFLICT (station_id) DO UPDATE SET name = excluded.name""",
+                               (station_id, name))
+        except Exception as e:
+            print("Error saving station:", e)
+
+    def fetch_stations(self):
+        """
+        Fetch every registered station as a dictionary mapping station id to name.
+        """
+        try:
+            with self.connect() as cursor:
+                cursor.execute("SELECT station_id, name FROM stations ORDER BY station_id")
+                return dict(cursor.fetchall())
+        except Exception as e:
+            print("Error fetching stations:", e)
+            return {}
+
     def purge_data(self):
         """
         Purge all data from the samples table without deleting the table itself.
         """
         try:
-            with DBCM(self.db_name) as cursor:
+            with self.connect() as cursor:
                 cursor.execute("DELETE FROM samples")
-                print("All data purged from the database.")
+                cursor.execute("DELETE FROM sync_state")
+                cursor.execute("DELETE FROM backfill_checkpoints")
+                cursor.execute("DELETE FROM monthly_stats")
+                cursor.execute("DELETE FROM month_coverage")
+            print("All data purged from the database.")
         except Exception as e:
             print("Error purging data:", e)
 
-    def save_data(self, weather_dict):
+    def save_data(self, weather_dict, station_id=DEFAULT_STATION_ID):
         """
         Save new weather data to the database if it doesn't already exist.
         """
+        rows = [(station_id, to_day_number(date), data["Min"], data["Max"], data["Mean"])
+                for date, data in weather_dict.items()]
+        if self.save_rows(rows) is not None:
+            print("New weather data saved successfully.")
+
+    def save_rows(self, rows):
+        """
+        Insert pre-built (station_id, day, min_temp, max_temp, avg_temp) tuples
+        with a single executemany in one transaction. The monthly_stats of the
+        months that received new days, and the coverage of every month in the
+        batch (including days whose values are missing), are updated in the
+        same transaction.
+        Returns the number of rows inserted, or None on error.
+        """
         try:
-            with DBCM(self.db_name) as cursor:
-                sql = """INSERT OR IGNORE INTO samples (date, location, min_temp, max_temp, avg_temp)
-                         VALUES (?, ?, ?, ?, ?)"""
-                location = "Winnipeg, MB"
-                for date, data in weather_dict.items():
-                    cursor.execute(sql, (date, location, data["Min"], data["Max"], data["Mean"]))
-                print("New weather data saved successfully.")
+            started = time.perf_counter()
+            with self.connect() as cursor:
+                cursor.execute("BEGIN IMMEDIATE")
+                new_rows = self.filter_new_rows(cursor, rows)
+                cursor.executemany("""INSERT OR IGNORE INTO samples (station_id, day, min_temp, max_temp, avg_temp)
+                                      VALUES (?, ?, ?, ?, ?)""", new_rows)
+                self.update_monthly_stats(cursor, new_rows)
+                self.update_coverage(cursor, rows)
+                committing = time.perf_counter()
+            finished = time.perf_counter()
+            METRICS.observe("db_transaction_seconds", finished - started)
+            METRICS.observe("db_commit_seconds", finished - committing)
+            METRICS.increment("rows_inserted_total", len(new_rows))
+            METRICS.increment("rows_ignored_total", len(rows) - len(new_rows))
+            METRICS.record("db_batch", rows=len(rows), rows_inserted=len(new_rows),
+                           rows_ignored=len(rows) - len(new_rows),
+                           transaction_seconds=finished - started, commit_seconds=finished - committing)
+            return len(new_rows)
         except Exception as e:
             print("Error saving weather data:", e)
+            return None
+
+    def filter_new_rows(self, cursor, rows):
+        """
+        Keep the rows that INSERT OR IGNORE would actually insert: complete rows
+        whose (station_id, day) is neither stored already nor repeated in the batch.
+        """
+        by_station = {}
+        for row in rows:
+            if None not in row:
+                by_station.setdefault(row[0], []).append(row)
+        new_rows = []
+        for station_id, station_rows in by_station.items():
+            days = [row[1] for row in station_rows]
+            cursor.execute("SELECT day FROM samples WHERE station_id = ? AND day BETWEEN ? AND ?",
+                           (station_id, min(days), max(days)))
+            seen = {day for (day,) in cursor.fetchall()}
+            for row in station_rows:
+                if row[1] not in seen:
+                    seen.add(row[1])
+                    new_rows.append(row)
+        return new_rows
+
+    def update_monthly_stats(self, cursor, rows):
+        """
+        Fold newly inserted rows into monthly_stats, reading and rewriting only
+        the months they touch.
+        """
+        touched = {}
+        for station_id, day, _, _, avg_temp in rows:
+            sample_date = EPOCH + timedelta(days=day)
+            key = (station_id, sample_date.year, sample_date.month)
+            touched.setdefault(key, MonthStats()).add(avg_temp)
+        for key, stats in touched.items():
+            cursor.execute("""SELECT count, sum, sum_sq, min, max, histogram FROM monthly_stats
+                              WHERE station_id = ? AND year = ? AND month = ?""", key)
+            row = cursor.fetchone()
+            if row:
+                stats = MonthStats.from_row(row).merge(stats)
+            cursor.execute("""INSERT OR REPLACE INTO monthly_stats
+                              (station_id, year, month, count, sum, sum_sq, min, max, histogram)
+                              VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)""", (*key, *stats.to_row()))
+
+    def rebuild_monthly_stats(self, cursor):
+        """
+        Recompute monthly_stats from every stored sample.
+        """
+        print("Building monthly statistics...")
+        cursor.execute("DELETE FROM monthly_stats")
+        reader = cursor.connection.cursor()
+        reader.execute("SELECT station_id, day, min_temp, max_temp, avg_temp FROM samples")
+        while True:
+            rows = reader.fetchmany(10000)
+            if not rows:
+                break
+            self.update_monthly_stats(cursor, rows)
+        reader.close()
+
+    def update_coverage(self, cursor, rows):
+        """
+        Fold a batch of rows into month_coverage. Bit d-1 of `present` is set
+        for day d when it is stored with all three temperatures; bit d-1 of
+        `nulls` when the source listed the day with a missing value and it is
+        not present.
+        """
+        masks = {}
+        for row in rows:
+            sample_date = EPOCH + timedelta(days=row[1])
+            key = (row[0], sample_date.year, sample_date.month)
+            present, nulls = masks.get(key, (0, 0))
+            bit = 1 << (sample_date.day - 1)
+            if None in row:
+                nulls |= bit
+            else:
+                present |= bit
+            masks[key] = (present, nulls)
+        cursor.executemany("""INSERT INTO month_coverage (station_id, year, month, present, nulls)
+                              VALUES (?, ?, ?, ?, ?)
+                              ON CONFLICT (station_id, year, month) DO UPDATE SET
+                                  present = present | excluded.present,
+                                  nulls = (nulls | excluded.nulls) & ~(present | excluded.present)""",
+                           [(*key, present, nulls & ~present) for key, (present, nulls) in masks.items()])
 
-    def fetch_data(self, start_date=None, end_date=None):
+    def rebuild_coverage(self, cursor):
+        """
+        Recompute month_coverage from every stored sample. Days that were
+        scraped with missing values were never stored, so they count as absent.
+        """
+        print("Building the coverage index...")
+        cursor.execute("DELETE FROM month_coverage")
+        reader = cursor.connection.cursor()
+        reader.execute("SELECT station_id, day, min_temp, max_temp, avg_temp FROM samples")
+        while True:
+            rows = reader.fetchmany(10000)
+            if not rows:
+                break
+            self.update_coverage(cursor, rows)
+        reader.close()
+
+    def fetch_data(self, start_date=None, end_date=None, station_id=None):
         """
         Fetch data from the database for plotting.
         If `start_date` and `end_date` are specified, retrieve data within the range.
-        Otherwise, retrieve all data.
+        Otherwise, retrieve all data. `station_id` limits the result to one station.
         Returns data as a list of dictionaries.
         """
         try:
-            with DBCM(self.db_name) as cursor:
+            with self.connect() as cursor:
+                conditions, params = [], []
+                if station_id is not None:
+                    conditions.append("s.station_id = ?")
+                    params.append(station_id)
                 if start_date and end_date:
-                    cursor.execute("""SELECT date, location, min_temp, max_temp, avg_temp
-                                      FROM samples
-                                      WHERE date BETWEEN ? AND ?""", (start_date, end_date))
-                else:
-                    cursor.execute("""SELECT date, location, min_temp, max_temp, avg_temp
-                                      FROM samples""")
+                    conditions.append("s.day BETWEEN ? AND ?")
+                    params.extend((to_day_number(start_date), to_day_number(end_date)))
+                where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+                cursor.execute(f"""SELECT s.day, st.name, s.min_temp, s.max_temp, s.avg_temp
+                                   FROM samples s LEFT JOIN stations st ON st.station_id = s.station_id
+                                   {where}
+                                   ORDER BY s.station_id, s.day""", params)
                 rows = cursor.fetchall()
                 return [
-                    {"date": row[0], "location": row[1], "min_temp": row[2], "max_temp": row[3], "avg_temp": row[4]}
+                    {"date": from_day_number(row[0]), "location": row[1], "min_temp": row[2],
+                     "max_temp": row[3], "avg_temp": row[4]}
                     for row in rows
                 ]
         except Exception as e:
             print("Error fetching data:", e)
             return []
 
+    def fetch_columns(self, start_date=None, end_date=None, station_id=None, raise_errors=False):
+        """
+        Fetch data as typed NumPy columns instead of dictionaries.
+        Takes the same filters as fetch_data. Returns a dictionary with
+        "station_id" (int64), "date" (datetime64[D]) and "min_temp", "max_temp",
+        "avg_temp" (float64) arrays, ordered by station and date.
+        With `raise_errors`, a database error is raised instead of printed.
+        """
+        import numpy as np
+
+        try:
+            with self.connect() as cursor:
+                conditions, params = [], []
+                if station_id is not None:
+                    conditions.append("station_id = ?")
+                    params.append(station_id)
+                if start_date and end_date:
+                    conditions.append("day BETWEEN ? AND ?")
+                    params.extend((to_day_number(start_date), to_day_number(end_date)))
+                where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+                cursor.execute(f"""SELECT station_id, day, min_temp, max_temp, avg_temp
+                                   FROM samples {where}
+                                   ORDER BY station_id, day""", params)
+                table = np.fromiter(cursor, dtype=SAMPLE_FIELDS)
+        except Exception as e:
+            if raise_errors:
+                raise
+            print("Error fetching data:", e)
+            table = np.empty(0, dtype=SAMPLE_FIELDS)
+        return {
+            "station_id": np.ascontiguousarray(table["station_id"]),
+            "date": table["day"].astype("datetime64[D]"),
+            "min_temp": np.ascontiguousarray(table["min_temp"]),
+            "max_temp": np.ascontiguousarray(table["max_temp"]),
+            "avg_temp": np.ascontiguousarray(table["avg_temp"]),
+        }
+
+    def fetch_monthly_stats(self, station_id, start_year, end_year, raise_errors=False):
+        """
+        Fetch the stored statistics of every month in a range of years.
+        Returns a dictionary mapping (year, month) to MonthStats.
+        With `raise_errors`, a database error is raised instead of printed.
+        """
+        try:
+            with self.connect() as cursor:
+                cursor.execute("""SELECT year, month, count, sum, sum_sq, min, max, histogram
+                                  FROM monthly_stats
+                                  WHERE station_id = ? AND year BETWEEN ? AND ?
+                                  ORDER BY year, month""", (station_id, start_year, end_year))
+                return {(row[0], row[1]): MonthStats.from_row(row[2:]) for row in cursor.fetchall()}
+        except Exception as e:
+            if raise_errors:
+                raise
+            print("Error fetching monthly statistics:", e)
+            return {}
+
+    def fetch_monthly_summary(self, station_id, start_year, end_year):
+        """
+        Summarize every month in a range of years.
+        Returns a dictionary mapping (year, month) to a summary dictionary
+        (count, mean, std, min, max and approximate quantiles q10 to q90).
+        """
+        stats = self.fetch_monthly_stats(station_id, start_year, end_year)
+        return {key: month_stats.summary() for key, month_stats in stats.items()}
+
+    def fetch_climate_summary(self, station_id, start_year, end_year, raise_errors=False):
+        """
+        Summarize each calendar month over a range of years, merging 12 rows per year.
+        Returns a dictionary mapping month (1-12) to a summary dictionary.
+        """
+        merged = {}
+        stats = self.fetch_monthly_stats(station_id, start_year, end_year, raise_errors)
+        for (_, month), month_stats in stats.items():
+            merged.setdefault(month, MonthStats()).merge(month_stats)
+        return {month: merged[month].summary() for month in sorted(merged)}
+
+    def get_latest_date(self, station_id=None):
+        """
+        Get the latest stored date, optionally for one station.
+        Answered from the primary key or day index, so it does not scan the table.
+        """
+        return self.get_date_bound("MAX", station_id)
+
+    def get_earliest_date(self, station_id=None):
+        """
+        Get the earliest stored date, optionally for one station.
+        """
+        return self.get_date_bound("MIN", station_id)
+
+    def get_date_bound(self, aggregate, station_id=None):
+        """
+        Run MIN() or MAX() over the day column. Returns a 'YYYY-MM-DD' string,
+        or None if there is no data.
+        """
+        try:
+            with self.connect() as cursor:
+                if station_id is not None:
+                    cursor.execute(f"SELECT {aggregate}(day) FROM samples WHERE station_id = ?", (station_id,))
+                else:
+                    cursor.execute(f"SELECT {aggregate}(day) FROM samples")
+                day = cursor.fetchone()[0]
+                return from_day_number(day) if day is not None else None
+        except Exception as e:
+            print("Error fetching date bound:", e)
+            return None
+
+    def count_rows_by_month(self, station_id=None):
+        """
+        Count the stored days per month.
+        Returns a dictionary mapping (year, month) to a row count.
+        """
+        try:
+            with self.connect() as cursor:
+                sql = """SELECT CAST(strftime('%Y', day * 86400, 'unixepoch') AS INTEGER),
+                                CAST(strftime('%m', day * 86400, 'unixepoch') AS INTEGER), COUNT(*)
+                         FROM samples {where}
+                         GROUP BY 1, 2"""
+                if station_id is not None:
+                    cursor.execute(sql.format(where="WHERE station_id = ?"), (station_id,))
+                else:
+                    cursor.execute(sql.format(where=""))
+                return {(year, month): count for year, month, count in cursor.fetchall()}
+        except Exception as e:
+            print("Error counting rows by month:", e)
+            return {}
+
+    def get_sync_state(self, station_id):
+        """
+        Get the high-watermark of a station: the last closed month that is fully synced.
+        Returns a (year, month) tuple, or None if the station was never synced.
+        """
+        try:
+            with self.connect() as cursor:
+                cursor.execute("""SELECT last_year, last_month FROM sync_state
+                                  WHERE station_id = ?""", (station_id,))
+                row = cursor.fetchone()
+                return (row[0], row[1]) if row else None
+        except Exception as e:
+            print("Error reading sync state:", e)
+            return None
+
+    def set_sync_state(self, station_id, year, month):
+        """
+        Store the high-watermark of a station.
+        """
+        try:
+            with self.connect() as cursor:
+                cursor.execute("""INSERT OR REPLACE INTO sync_state (station_id, last_year, last_month, updated_at)
+                                  VALUES (?, ?, ?, ?)""",
+                               (station_id, year, month, datetime.now().isoformat(timespec="seconds")))
+        except Exception as e:
+            print("Error saving sync state:", e)
+
+    def fetch_coverage(self, station_id):
+        """
+        Get the coverage index of a station.
+        Returns a dictionary mapping (year, month) to (present, nulls, repair_attempts).
+        """
+        try:
+            with self.connect() as cursor:
+                cursor.execute("""SELECT year, month, present, nulls, repair_attempts FROM month_coverage
+                                  WHERE station_id = ?""", (station_id,))
+                return {(row[0], row[1]): (row[2], row[3], row[4]) for row in cursor.fetchall()}
+        except Exception as e:
+            print("Error reading coverage:", e)
+            return {}
+
+    def find_incomplete_months(self, station_id, first, last, max_attempts=1):
+        """
+        List the months from `first` to `last` (inclusive (year, month) pairs)
+        that miss days, as (year, month, missing_days, null_days) tuples where
+        the day lists are 1-based. Months without any stored day count as fully
+        missing. Months that were already repaired `max_attempts` times and are
+        still incomplete are left out: their gaps are likely in the source.
+        """
+        coverage = self.fetch_coverage(station_id)
+        incomplete = []
+        year, month = first
+        while (year, month) <= last:
+            present, nulls, attempts = coverage.get((year, month), (0, 0, 0))
+            days = calendar.monthrange(year, month)[1]
+            if present != (1 << days) - 1 and attempts < max_attempts:
+                missing = [day for day in range(1, days + 1) if not present >> (day - 1) & 1]
+                null_days = [day for day in missing if nulls >> (day - 1) & 1]
+                incomplete.append((year, month, missing, null_days))
+            year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+        return incomplete
+
+    def record_repair_attempts(self, station_id, months):
+        """
+        Count one repair attempt for each (year, month) of a station.
+        """
+        try:
+            with self.connect() as cursor:
+                cursor.executemany("""INSERT INTO month_coverage (station_id, year, month, present, nulls, repair_attempts)
+                                      VALUES (?, ?, ?, 0, 0, 1)
+                                      ON CONFLICT (station_id, year, month) DO UPDATE SET
+                                          repair_attempts = repair_attempts + 1""",
+                                   [(station_id, year, month) for year, month in months])
+        except Exception as e:
+            print("Error saving repair attempts:", e)
+
+    def get_station_range(self, station_id):
+        """
+        Get the discovered range of months with data for a station on the source site.
+        Returns ((first_year, first_month), (last_year, last_month), checked_at),
+        or None if it was never discovered.
+        """
+        try:
+            with self.connect() as cursor:
+                cursor.execute("""SELECT first_year, first_month, last_year, last_month, checked_at
+                                  FROM station_ranges WHERE station_id = ?""", (station_id,))
+                row = cursor.fetchone()
+                if row is None:
+                    return None
+                return (row[0], row[1]), (row[2], row[3]), datetime.fromisoformat(row[4])
+        except Exception as e:
+            print("Error reading station range:", e)
+            return None
+
+    def set_station_range(self, station_id, first, last):
+        """
+        Store the discovered range of a station as (year, month) bounds.
+        """
+        try:
+            with self.connect() as cursor:
+                cursor.execute("""INSERT OR REPLACE INTO station_ranges
+                                  (station_id, first_year, first_month, last_year, last_month, checked_at)
+                                  VALUES (?, ?, ?, ?, ?, ?)""",
+                               (station_id, *first, *last, datetime.now().isoformat(timespec="seconds")))
+        except Exception as e:
+            print("Error saving station range:", e)
+
+    def get_checkpoints(self, station_id=None):
+        """
+        Get the months a backfill has already completed.
+        Returns a set of (station_id, year, month) tuples.
+        """
+        try:
+            with self.connect() as cursor:
+                if station_id is not None:
+                    cursor.execute("""SELECT station_id, year, month FROM backfill_checkpoints
+                                      WHERE station_id = ?""", (station_id,))
+                else:
+                    cursor.execute("SELECT station_id, year, month FROM backfill_checkpoints")
+                return set(cursor.fetchall())
+        except Exception as e:
+            print("Error reading backfill checkpoints:", e)
+            return set()
+
+    def save_checkpoints(self, checkpoints):
+        """
+        Record (station_id, year, month, days) tuples as completed backfill months.
+        """
+        try:
+            with self.connect() as cursor:
+                completed_at = datetime.now().isoformat(timespec="seconds")
+                cursor.executemany("""INSERT OR REPLACE INTO backfill_checkpoints
+                                      (station_id, year, month, days, completed_at)
+                                      VALUES (?, ?, ?, ?, ?)""",
+                                   [(*checkpoint, completed_at) for checkpoint in checkpoints])
+        except Exception as e:
+            print("Error saving backfill checkpoints:", e)
+
+    def clear_checkpoints(self, station_id):
+        """
+        Forget the completed backfill months of a station.
+        """
+        try:
+            with self.connect() as cursor:
+                cursor.execute("DELETE FROM backfill_checkpoints WHERE station_id = ?", (station_id,))
+        except Exception as e:
+            print("Error clearing backfill checkpoints:", e)
+
 if __name__ == "__main__":
     db = DBOperations()
     db.initialize_db()
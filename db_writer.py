@@ -0,0 +1,100 @@
+"""
+Module to batch database writes on a dedicated writer thread.
+"""
+
+import queue
+import threading
+import time
+from db_operations import DEFAULT_STATION_ID, to_day_number
+
+DEFAULT_BATCH_SIZE = 5000
+DEFAULT_FLUSH_INTERVAL = 0.5
+DEFAULT_QUEUE_SIZE = 256
+_STOP = object()
+
+
+class BulkWriter:
+    """
+    Single writer thread that owns every insert into the database.
+
+    Scraper workers call `save_data` (same signature as DBOperations.save_data),
+    which only queues the rows. The writer thread groups them into batches of
+    up to `batch_size` rows, or whatever arrived within `flush_interval`
+    seconds, and commits each batch in one transaction, so concurrent scrapers
+    never contend for the SQLite write lock.
+    """
+    def __init__(self, db, batch_size=DEFAULT_BATCH_SIZE, flush_interval=DEFAULT_FLUSH_INTERVAL,
+                 queue_size=DEFAULT_QUEUE_SIZE):
+        self.db = db
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.thread = threading.Thread(target=self.run, name="db-writer", daemon=True)
+        self.rows_written = 0
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def start(self):
+        """Start the writer thread."""
+        self.thread.start()
+
+    def save_data(self, weather_dict, station_id=DEFAULT_STATION_ID):
+        """
+        Queue a month of scraped weather data for writing.
+        """
+        rows = [(station_id, to_day_number(date), data["Min"], data["Max"], data["Mean"])
+                for date, data in weather_dict.items()]
+        self.queue.put((rows, []))
+
+    def save_month(self, weather_dict, station_id, year, month):
+        """
+        Queue a month of weather data together with its backfill checkpoint.
+        The checkpoint is only recorded after the batch holding its rows is committed.
+        """
+        rows = [(station_id, to_day_number(date), data["Min"], data["Max"], data["Mean"])
+                for date, data in weather_dict.items()]
+        self.queue.put((rows, [(station_id, year, month, len(rows))]))
+
+    def close(self):
+        """Flush every queued row and stop the writer thread."""
+        if self.thread.is_alive():
+            self.queue.put(_STOP)
+            self.thread.join()
+
+    def run(self):
+        """Writer loop: drain the queue into batches and commit them."""
+        batch, checkpoints = [], []
+        deadline = None
+        while True:
+            timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+            try:
+                item = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+
+            if item is _STOP:
+                self.flush(batch, checkpoints)
+                return
+            if item:
+                batch.extend(item[0])
+                checkpoints.extend(item[1])
+                if deadline is None:
+                    deadline = time.monotonic() + self.flush_interval
+            if (batch or checkpoints) and (len(batch) >= self.batch_size or time.monotonic() >= deadline):
+                self.flush(batch, checkpoints)
+                batch, checkpoints = [], []
+                deadline = None
+
+    def flush(self, batch, checkpoints):
+        """Write one batch in a single transaction, then record its checkpoints."""
+        inserted = self.db.save_rows(batch) if batch else 0
+        if inserted is None:
+            return  # not committed, so the months stay pending
+        self.rows_written += inserted
+        if checkpoints:
+            self.db.save_checkpoints(checkpoints)
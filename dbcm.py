@@ -1,24 +1,90 @@
 """
 Context manager module to manage the database connections.
+
+Connections are pooled per thread: the first DBCM used on a thread opens a
+connection, applies the pragmas once and keeps it open for every later DBCM
+on that thread, so small reads don't pay connection setup, schema parsing
+or a cold page cache each time.
 """
 
+import os
 import sqlite3
+import threading
+import weakref
+
+CACHED_STATEMENTS = 256
+
+_local = threading.local()
+_all_connections = weakref.WeakSet()
+_all_lock = threading.Lock()
+_generation = 0  # bumped by close_all_connections so threads drop their closed pools
+
+
+class PooledConnection(sqlite3.Connection):
+    """sqlite3 connection that can be tracked by the pool."""
+
+
+def get_connection(db_name, pragmas):
+    """
+    Return this thread's persistent connection to a database, opening it and
+    applying the pragmas on first use.
+    """
+    pool = getattr(_local, "pool", None)
+    if pool is None or _local.pid != os.getpid() or _local.generation != _generation:
+        pool = _local.pool = {}  # connections must not cross a fork
+        _local.pid = os.getpid()
+        _local.generation = _generation
+    key = (db_name, tuple(sorted(pragmas.items())))
+    conn = pool.get(key)
+    if conn is None:
+        conn = sqlite3.connect(db_name, factory=PooledConnection, check_same_thread=False,
+                               cached_statements=CACHED_STATEMENTS)
+        for name, value in pragmas.items():
+            conn.execute(f"PRAGMA {name} = {value}")
+        pool[key] = conn
+        with _all_lock:
+            _all_connections.add(conn)
+    return conn
+
+
+def close_connections(db_name=None):
+    """
+    Close the calling thread's pooled connections (only those to `db_name` if given).
+    """
+    pool = getattr(_local, "pool", {})
+    for key in list(pool):
+        if db_name is None or key[0] == db_name:
+            pool.pop(key).close()
+
+
+def close_all_connections():
+    """Close the pooled connections of every thread."""
+    global _generation
+    with _all_lock:
+        _generation += 1
+        for conn in list(_all_connections):
+            conn.close()
+        _all_connections.clear()
+
 
 class DBCM:
     """Database connection manager."""
-    def __init__(self, db_name):
+    def __init__(self, db_name, pragmas=None):
         self.db_name = db_name
+        self.pragmas = pragmas or {}
         self.conn = None
         self.cursor = None
 
     def __enter__(self):
-        """Establish a database connection and return the cursor."""
-        self.conn = sqlite3.connect(self.db_name)
+        """Borrow this thread's pooled connection and return a cursor."""
+        self.conn = get_connection(self.db_name, self.pragmas)
         self.cursor = self.conn.cursor()
         return self.cursor
 
     def __exit__(self, exc_type, exc_value, traceback):
-        """Commit changes and close the connection."""
+        """Commit changes, or roll them back on error. The connection stays open."""
         if exc_type is None:
             self.conn.commit()
-        self.conn.close()
+        else:
+            self.conn.rollback()
+        self.cursor.close()
@@ -0,0 +1,165 @@
+"""
+Module to manage reusable keep-alive HTTP connections.
+"""
+
+import gzip
+import http.client
+import threading
+import zlib
+from urllib.parse import urlsplit, urljoin
+
+DEFAULT_TIMEOUT = 30
+MAX_REDIRECTS = 5
+CHUNK_SIZE = 16 * 1024
+# When a streamed body is abandoned with at most this many bytes left, they are
+# read and discarded so the connection can be kept alive; otherwise it is closed.
+DRAIN_LIMIT = 64 * 1024
+USER_AGENT = "weather-app/1.0 (+https://github.com/noahyanga/weather-app)"
+
+# Errors raised when the server has closed an idle keep-alive connection.
+STALE_CONNECTION_ERRORS = (http.client.RemoteDisconnected, http.client.CannotSendRequest,
+                           http.client.BadStatusLine, BrokenPipeError, ConnectionResetError)
+
+
+class Response:
+    """
+    A read HTTP response. `complete` is False when a streaming consumer stopped
+    reading early, in which case `body` holds only the bytes read until then.
+    `length` is the number of body bytes read, also when `body` was not kept.
+    """
+    def __init__(self, url, status, headers, body, complete=True, length=None):
+        self.url = url
+        self.status = status
+        self.headers = headers
+        self.body = body
+        self.complete = complete
+        self.length = len(body) if length is None else length
+
+
+class HTTPSession:
+    """
+    HTTP client that keeps one persistent connection per host and thread,
+    so consecutive requests to the same server skip the TCP/TLS handshake.
+    """
+    def __init__(self, timeout=DEFAULT_TIMEOUT):
+        self.timeout = timeout
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.all_connections = []
+
+    def get_connection(self, scheme, netloc):
+        """Return this thread's open connection to a host, creating it if needed."""
+        connections = getattr(self.local, "connections", None)
+        if connections is None:
+            connections = self.local.connections = {}
+        conn = connections.get((scheme, netloc))
+        if conn is None:
+            conn_class = http.client.HTTPSConnection if scheme == "https" else http.client.HTTPConnection
+            conn = conn_class(netloc, timeout=self.timeout)
+            connections[(scheme, netloc)] = conn
+            with self.lock:
+                self.all_connections.append(conn)
+        return conn
+
+    def drop_connection(self, scheme, netloc):
+        """Close and forget this thread's connection to a host."""
+        conn = self.local.connections.pop((scheme, netloc), None)
+        if conn is not None:
+            conn.close()
+            with self.lock:
+                if conn in self.all_connections:
+                    self.all_connections.remove(conn)
+
+    def get(self, url, headers=None, on_chunk=None, keep_body=True):
+        """
+        Send a GET request and return the Response, following redirects.
+
+        With `on_chunk`, the body of a 200 response is handed to it
+        (decompressed) as it arrives off the socket; returning False from
+        `on_chunk` stops reading the rest of the body. Unless `keep_body` is
+        set, the streamed chunks are then not collected and `body` is empty.
+        """
+        for _ in range(MAX_REDIRECTS + 1):
+            response = self.request_once(url, headers, on_chunk, keep_body)
+            if response.status in (301, 302, 303, 307, 308) and "Location" in response.headers:
+                url = urljoin(url, response.headers["Location"])
+                continue
+            return response
+        raise http.client.HTTPException(f"Too many redirects for {url}")
+
+    def request_once(self, url, headers=None, on_chunk=None, keep_body=True):
+        """Send a single GET request, retrying once if the kept-alive connection went stale."""
+        parts = urlsplit(url)
+        path = parts.path or "/"
+        if parts.query:
+            path += "?" + parts.query
+        request_headers = {"User-Agent": USER_AGENT, "Accept-Encoding": "gzip",
+                           "Connection": "keep-alive"}
+        request_headers.update(headers or {})
+
+        for attempt in range(2):
+            conn = self.get_connection(parts.scheme, parts.netloc)
+            try:
+                conn.request("GET", path, headers=request_headers)
+                raw = conn.getresponse()
+            except STALE_CONNECTION_ERRORS:
+                self.drop_connection(parts.scheme, parts.netloc)
+                if attempt:
+                    raise
+                continue
+            except Exception:
+                self.drop_connection(parts.scheme, parts.netloc)
+                raise
+
+            # Once the body has started, a failure can't be retried: the
+            # consumer may already have seen part of it.
+            try:
+                if on_chunk is not None and raw.status == 200:
+                    body, complete, length = self.read_streaming(raw, on_chunk, keep_body)
+                else:
+                    body, complete = raw.read(), True
+                    if raw.getheader("Content-Encoding") == "gzip":
+                        body = gzip.decompress(body)
+                    length = len(body)
+            except Exception:
+                self.drop_connection(parts.scheme, parts.netloc)
+                raise
+            if raw.will_close or not raw.isclosed():
+                self.drop_connection(parts.scheme, parts.netloc)
+            return Response(url, raw.status, raw.headers, body, complete, length)
+
+    def read_streaming(self, raw, on_chunk, keep_body=True):
+        """
+        Read a body in chunks, passing each to `on_chunk` until it returns False.
+        If reading stops early, a small remainder is drained so the connection
+        stays reusable; a large one is left unread and the connection is closed
+        by the caller. Returns (bytes read, whether the whole body was read,
+        their length); the bytes are empty unless `keep_body` is set.
+        """
+        decompressor = None
+        if raw.getheader("Content-Encoding") == "gzip":
+            decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        chunks = []
+        length = 0
+        while True:
+            chunk = raw.read1(CHUNK_SIZE)
+            if not chunk:
+                return b"".join(chunks), True, length
+            if decompressor is not None:
+                chunk = decompressor.decompress(chunk)
+            length += len(chunk)
+            if keep_body:
+                chunks.append(chunk)
+            if chunk and on_chunk(chunk) is False:
+                break
+        if raw.length is not None and raw.length <= DRAIN_LIMIT:
+            raw.read()
+        return b"".join(chunks), False, length
+
+    def close(self):
+        """Close every connection opened by this session."""
+        with self.lock:
+            for conn in self.all_connections:
+                conn.close()
+            self.all_connections.clear()
+        self.local = threading.local()
@@ -0,0 +1,100 @@
+"""
+Module to run slow work off the Tk main loop.
+"""
+
+import logging
+import queue
+import threading
+
+POLL_INTERVAL_MS = 100
+
+
+class Job:
+    """A background job and its cancel flag."""
+    def __init__(self, name):
+        self.name = name
+        self.cancel_event = threading.Event()
+        self.thread = None
+
+    def cancel(self):
+        """Ask the job to stop at the next checkpoint."""
+        self.cancel_event.set()
+
+    @property
+    def cancelled(self):
+        """Whether the job was asked to stop."""
+        return self.cancel_event.is_set()
+
+
+class JobRunner:
+    """
+    Runs callables on worker threads and marshals their progress, results and
+    errors back to the Tk main thread through `root.after`.
+
+    The callable is invoked as `func(progress, cancel_event)`, where
+    `progress(*values)` forwards values to `on_progress` on the main thread and
+    `cancel_event` is set when the user cancels the job.
+    """
+    def __init__(self, root):
+        self.root = root
+        self.messages = queue.Queue()
+        self.jobs = []
+        self.polling = False
+
+    def start(self, name, func, on_done=None, on_error=None, on_progress=None):
+        """Start a job and return it."""
+        job = Job(name)
+
+        def progress(*values):
+            if on_progress is not None:
+                self.messages.put((on_progress, values))
+
+        def run():
+            try:
+                result = func(progress, job.cancel_event)
+            except Exception as e:
+                if on_error is not None:
+                    self.messages.put((on_error, (e,)))
+                else:
+                    logging.error("Job %s failed: %s", name, e)
+            else:
+                if on_done is not None:
+                    self.messages.put((on_done, (result,)))
+            finally:
+                self.messages.put((self.finish, (job,)))
+
+        job.thread = threading.Thread(target=run, name=f"job-{name}", daemon=True)
+        self.jobs.append(job)
+        job.thread.start()
+        if not self.polling:
+            self.polling = True
+            self.root.after(POLL_INTERVAL_MS, self.poll)
+        return job
+
+    def finish(self, job):
+        """Forget a finished job."""
+        if job in self.jobs:
+            self.jobs.remove(job)
+
+    def poll(self):
+        """Deliver queued callbacks on the main thread."""
+        while True:
+            try:
+                callback, args = self.messages.get_nowait()
+            except queue.Empty:
+                break
+            callback(*args)
+        if self.jobs or not self.messages.empty():
+            self.root.after(POLL_INTERVAL_MS, self.poll)
+        else:
+            self.polling = False
+
+    def cancel_all(self):
+        """Cancel every running job."""
+        for job in self.jobs:
+            job.cancel()
+
+    @property
+    def busy(self):
+        """Whether any job is running."""
+        return bool(self.jobs)
@@ -0,0 +1,161 @@
+"""
+Module to collect pipeline metrics.
+
+Counters and timers are kept in one thread-safe registry, `METRICS`, that the
+scraper, database and processor report to. Per-month (and per-batch) records
+are kept as events alongside the aggregates. Everything can be exported as a
+JSON summary or in the Prometheus text exposition format, e.g. for the node
+exporter's textfile collector.
+"""
+
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+PROMETHEUS_PREFIX = "weather_"
+MAX_EVENTS = 10000
+
+
+def label_key(labels):
+    """Turn keyword labels into a hashable, ordered key."""
+    return tuple(sorted((name, str(value).lower() if isinstance(value, bool) else str(value))
+                        for name, value in labels.items()))
+
+
+def format_labels(key):
+    """Format a label key as a Prometheus label set."""
+    if not key:
+        return ""
+    escaped = (value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in key)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(key, escaped)) + "}"
+
+
+class Timer:
+    """Count, sum, min and max of observed durations in seconds."""
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.minimum = None
+        self.maximum = None
+
+    def observe(self, seconds):
+        """Add one duration."""
+        self.count += 1
+        self.total += seconds
+        self.minimum = seconds if self.minimum is None else min(self.minimum, seconds)
+        self.maximum = seconds if self.maximum is None else max(self.maximum, seconds)
+
+    def summary(self):
+        """Return the timer as a dictionary."""
+        return {"count": self.count, "sum": self.total,
+                "mean": self.total / self.count if self.count else None,
+                "min": self.minimum, "max": self.maximum}
+
+
+class Metrics:
+    """
+    Thread-safe registry of counters, timers and events.
+    Metrics are identified by a name and optional keyword labels.
+    """
+    def __init__(self, max_events=MAX_EVENTS):
+        self.lock = threading.Lock()
+        self.counters = {}  # (name, label key) -> value
+        self.timers = {}  # (name, label key) -> Timer
+        self.events = deque(maxlen=max_events)
+
+    def increment(self, name, value=1, **labels):
+        """Add `value` to a counter."""
+        key = (name, label_key(labels))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, seconds, **labels):
+        """Record one duration of a timer."""
+        key = (name, label_key(labels))
+        with self.lock:
+            timer = self.timers.get(key)
+            if timer is None:
+                timer = self.timers[key] = Timer()
+            timer.observe(seconds)
+
+    @contextmanager
+    def timer(self, name, **labels):
+        """Time the body of a `with` block."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def record(self, kind, **fields):
+        """Keep one event, e.g. the timings of a scraped month. Old events are dropped first."""
+        with self.lock:
+            self.events.append({"kind": kind, "time": time.time(), **fields})
+
+    def reset(self):
+        """Forget every metric and event."""
+        with self.lock:
+            self.counters.clear()
+            self.timers.clear()
+            self.events.clear()
+
+    def summary(self):
+        """Return every metric and event as a JSON-serializable dictionary."""
+        with self.lock:
+            return {
+                "counters": [{"name": name, "labels": dict(key), "value": value}
+                             for (name, key), value in sorted(self.counters.items())],
+                "timers": [{"name": name, "labels": dict(key), **timer.summary()}
+                           for (name, key), timer in sorted(self.timers.items())],
+                "events": list(self.events),
+            }
+
+    def to_json(self):
+        """Export the summary as JSON."""
+        return json.dumps(self.summary(), indent=2)
+
+    def to_prometheus(self):
+        """
+        Export counters and timers in the Prometheus text format. Timers become
+        summaries without quantiles (`_count` and `_sum`); events are not exported.
+        """
+        lines = []
+        with self.lock:
+            counters = sorted(self.counters.items())
+            timers = sorted((key, timer.summary()) for key, timer in self.timers.items())
+        typed = set()
+        for (name, key), value in counters:
+            metric = PROMETHEUS_PREFIX + name
+            if metric not in typed:
+                typed.add(metric)
+                lines.append(f"# TYPE {metric} counter")
+            lines.append(f"{metric}{format_labels(key)} {value}")
+        for (name, key), summary in timers:
+            metric = PROMETHEUS_PREFIX + name
+            if metric not in typed:
+                typed.add(metric)
+                lines.append(f"# TYPE {metric} summary")
+            lines.append(f"{metric}_count{format_labels(key)} {summary['count']}")
+            lines.append(f"{metric}_sum{format_labels(key)} {summary['sum']}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, path, text):
+        """Write an export atomically, so a collector never reads half a file."""
+        temporary = f"{path}.tmp"
+        with open(temporary, "w", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(temporary, path)
+
+    def write_json(self, path):
+        """Write the JSON summary to `path`."""
+        self.write(path, self.to_json())
+
+    def write_prometheus(self, path):
+        """Write the Prometheus text export to `path`."""
+        self.write(path, self.to_prometheus())
+
+
+METRICS = Metrics()
@@ -0,0 +1,101 @@
+"""
+Module to accumulate monthly temperature statistics.
+
+Each month keeps count, sum, sum of squares, min, max and a fixed-bin
+histogram of the daily mean temperature. All of these can be merged, so a
+month is updated incrementally as days arrive and a multi-year summary is
+just the merge of its months. Quantiles are approximated from the histogram
+to within half a bin width.
+"""
+
+import math
+from array import array
+
+HIST_MIN = -60.0
+HIST_MAX = 50.0
+BIN_WIDTH = 0.5
+N_BINS = int((HIST_MAX - HIST_MIN) / BIN_WIDTH)
+SUMMARY_QUANTILES = (0.1, 0.25, 0.5, 0.75, 0.9)
+
+
+class MonthStats:
+    """Mergeable statistics of the daily mean temperatures of one or more months."""
+    def __init__(self, count=0, total=0.0, total_sq=0.0, minimum=None, maximum=None, histogram=None):
+        self.count = count
+        self.total = total
+        self.total_sq = total_sq
+        self.minimum = minimum
+        self.maximum = maximum
+        self.histogram = histogram if histogram is not None else array('I', bytes(4 * N_BINS))
+
+    @classmethod
+    def from_row(cls, row):
+        """Build from a (count, sum, sum_sq, min, max, histogram) database row."""
+        histogram = array('I')
+        histogram.frombytes(row[5])
+        return cls(row[0], row[1], row[2], row[3], row[4], histogram)
+
+    def to_row(self):
+        """Return the (count, sum, sum_sq, min, max, histogram) database row."""
+        return (self.count, self.total, self.total_sq, self.minimum, self.maximum,
+                self.histogram.tobytes())
+
+    def add(self, value):
+        """Add one daily mean temperature."""
+        self.count += 1
+        self.total += value
+        self.total_sq += value * value
+        self.minimum = value if self.minimum is None else min(self.minimum, value)
+        self.maximum = value if self.maximum is None else max(self.maximum, value)
+        index = int((value - HIST_MIN) // BIN_WIDTH)
+        self.histogram[min(max(index, 0), N_BINS - 1)] += 1
+
+    def merge(self, other):
+        """Fold another MonthStats into this one."""
+        if not other.count:
+            return self
+        self.count += other.count
+        self.total += other.total
+        self.total_sq += other.total_sq
+        self.minimum = other.minimum if self.minimum is None else min(self.minimum, other.minimum)
+        self.maximum = other.maximum if self.maximum is None else max(self.maximum, other.maximum)
+        for index, value in enumerate(other.histogram):
+            if value:
+                self.histogram[index] += value
+        return self
+
+    @property
+    def mean(self):
+        """Mean of the daily values, or None without data."""
+        return self.total / self.count if self.count else None
+
+    @property
+    def std(self):
+        """Population standard deviation of the daily values, or None without data."""
+        if not self.count:
+            return None
+        variance = self.total_sq / self.count - (self.total / self.count) ** 2
+        return math.sqrt(max(variance, 0.0))
+
+    def quantile(self, q):
+        """
+        Approximate the q-quantile by interpolating inside the histogram bin that holds it.
+        """
+        if not self.count:
+            return None
+        target = q * self.count
+        seen = 0
+        for index, value in enumerate(self.histogram):
+            if value and seen + value >= target:
+                estimate = HIST_MIN + BIN_WIDTH * (index + (target - seen) / value)
+                return min(max(estimate, self.minimum), self.maximum)
+            seen += value
+        return self.maximum
+
+    def summary(self):
+        """Return count, mean, std, min, max and the summary quantiles as a dictionary."""
+        result = {"count": self.count, "mean": self.mean, "std": self.std,
+                  "min": self.minimum, "max": self.maximum}
+        for q in SUMMARY_QUANTILES:
+            result[f"q{int(q * 100)}"] = self.quantile(q)
+        return result
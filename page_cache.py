@@ -0,0 +1,142 @@
+"""
+Module to cache raw month pages on disk.
+"""
+
+import json
+import os
+import threading
+import time
+
+CACHE_DIR = "page_cache"
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+
+class CachedPage:
+    """
+    A cached month page and the validators needed to revalidate it. A `partial`
+    page holds only the start of the page, up to the end of the daily data table.
+    """
+    def __init__(self, body, etag=None, last_modified=None, fetched_at=None, partial=False):
+        self.body = body
+        self.etag = etag
+        self.last_modified = last_modified
+        self.fetched_at = fetched_at
+        self.partial = partial
+
+    def conditional_headers(self):
+        """Headers that turn the next fetch of this page into a conditional request."""
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+
+class PageCache:
+    """
+    Size-bounded on-disk cache of raw month pages keyed by (station, year, month).
+    The least recently used pages are evicted once `max_bytes` is exceeded.
+    """
+    def __init__(self, directory=CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.total_bytes = None
+
+    def page_path(self, station_id, year, month):
+        """Return the file path of a cached page."""
+        return os.path.join(self.directory, str(station_id), f"{year}-{month:02}.html")
+
+    def get(self, station_id, year, month):
+        """
+        Return the cached page for a month, or None if it is not cached.
+        """
+        path = self.page_path(station_id, year, month)
+        try:
+            with open(path, "rb") as f:
+                body = f.read()
+            with open(path + ".json", "r", encoding="utf-8") as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return None
+        os.utime(path)  # mark as recently used
+        return CachedPage(body, meta.get("etag"), meta.get("last_modified"), meta.get("fetched_at"),
+                          meta.get("partial", False))
+
+    def put(self, station_id, year, month, body, etag=None, last_modified=None, partial=False):
+        """
+        Store a freshly downloaded page and evict old pages if the cache is too large.
+        Set `partial` when the download stopped before the end of the page.
+        """
+        path = self.page_path(station_id, year, month)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self.lock:
+            self.ensure_total()
+            try:
+                self.total_bytes -= os.path.getsize(path)
+            except OSError:
+                pass
+            tmp_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(body)
+            os.replace(tmp_path, path)
+            self.write_meta(path, etag, last_modified, partial)
+            self.total_bytes += len(body)
+            if self.total_bytes > self.max_bytes:
+                self.evict()
+
+    def touch(self, station_id, year, month):
+        """Record that a cached page was revalidated with the server."""
+        path = self.page_path(station_id, year, month)
+        cached = self.get(station_id, year, month)
+        if cached is not None:
+            self.write_meta(path, cached.etag, cached.last_modified, cached.partial)
+
+    def write_meta(self, path, etag, last_modified, partial=False):
+        """Write the validators stored next to a cached page."""
+        meta = {"etag": etag, "last_modified": last_modified, "partial": partial, "fetched_at": time.time()}
+        with open(path + ".json", "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+
+    def list_pages(self):
+        """Return (mtime, size, path) for every cached page."""
+        pages = []
+        if not os.path.isdir(self.directory):
+            return pages
+        for station_dir in os.scandir(self.directory):
+            if not station_dir.is_dir():
+                continue
+            for entry in os.scandir(station_dir.path):
+                if entry.name.endswith(".html"):
+                    stat = entry.stat()
+                    pages.append((stat.st_mtime, stat.st_size, entry.path))
+        return pages
+
+    def ensure_total(self):
+        """Compute the cache size on first use."""
+        if self.total_bytes is None:
+            self.total_bytes = sum(size for _, size, _ in self.list_pages())
+
+    def evict(self):
+        """Remove least recently used pages until the cache fits in `max_bytes`."""
+        for _, size, path in sorted(self.list_pages()):
+            if self.total_bytes <= self.max_bytes:
+                break
+            for stale in (path, path + ".json"):
+                try:
+                    os.remove(stale)
+                except OSError:
+                    pass
+            self.total_bytes -= size
+
+    def clear(self):
+        """Remove every cached page."""
+        with self.lock:
+            for _, _, path in self.list_pages():
+                for stale in (path, path + ".json"):
+                    try:
+                        os.remove(stale)
+                    except OSError:
+                        pass
+            self.total_bytes = 0
@@ -2,17 +2,26 @@
 Module to plot weather data.
 """
 
-import matplotlib.pyplot as plt
+from matplotlib.figure import Figure
+
+BOXPLOT_SIZE = (12, 6)
+LINEPLOT_SIZE = (10, 9)
+
+
 class PlotOperations:
     """
     Class to plot weather data.
+    The draw_* methods render onto any Axes; the plot_* methods show them in a
+    pyplot window and the *_figure methods return a standalone Figure that can
+    be embedded in Tk or saved without pyplot.
     """
     def __init__(self, data):
         self.data = data
 
-    def plot_boxplot(self, start_year, end_year):
+    def draw_boxplot(self, ax, start_year, end_year):
         """
-        Create a boxplot of mean temperatures from start_year to end_year.
+        Draw a boxplot of mean temperatures from start_year to end_year.
+        `self.data` maps year to month to daily mean temperatures.
         """
         # Prepare data for boxplot
         boxplot_data = {month: [] for month in range(1, 13)}
@@ -21,36 +30,112 @@ class PlotOperations:
                 for month, temps in self.data[year].items():
                     boxplot_data[month].extend(temps)
 
-        # Create boxplot
-        plt.figure(figsize=(12, 6))
-        plt.boxplot([boxplot_data[month] for month in range(1, 13)], labels=[f'{month}' for month in range(1, 13)])
-        plt.title(f'Monthly Temperature Distribution for {start_year} to {end_year}')
-        plt.xlabel('Month')
-        plt.ylabel('Temperature (°C)')
-        plt.grid(True)
+        ax.boxplot([boxplot_data[month] for month in range(1, 13)])
+        ax.set_xticks(range(1, 13), [f'{month}' for month in range(1, 13)])
+        self.label_boxplot(ax, start_year, end_year)
+
+    def draw_boxplot_summary(self, ax, start_year, end_year):
+        """
+        Draw a boxplot from precomputed monthly summaries instead of raw days.
+        `self.data` maps month (1-12) to a summary from DBOperations.fetch_climate_summary.
+        Whiskers reach 1.5 IQR past the quartiles, clipped to the observed range.
+        """
+        boxes = []
+        for month in range(1, 13):
+            summary = self.data.get(month)
+            if not summary or not summary["count"]:
+                boxes.append({"label": f'{month}', "med": float('nan'), "q1": float('nan'),
+                              "q3": float('nan'), "whislo": float('nan'), "whishi": float('nan'),
+                              "fliers": []})
+                continue
+            iqr = summary["q75"] - summary["q25"]
+            boxes.append({
+                "label": f'{month}',
+                "med": summary["q50"],
+                "q1": summary["q25"],
+                "q3": summary["q75"],
+                "whislo": max(summary["min"], summary["q25"] - 1.5 * iqr),
+                "whishi": min(summary["max"], summary["q75"] + 1.5 * iqr),
+                "fliers": [],
+            })
+
+        ax.bxp(boxes)
+        self.label_boxplot(ax, start_year, end_year)
+
+    def label_boxplot(self, ax, start_year, end_year):
+        """Add the title, axis labels and grid of a boxplot."""
+        ax.set_title(f'Monthly Temperature Distribution for {start_year} to {end_year}')
+        ax.set_xlabel('Month')
+        ax.set_ylabel('Temperature (°C)')
+        ax.grid(True)
+
+    def draw_lineplot(self, ax, year, month):
+        """
+        Draw a line plot of mean temperatures for a specific month and year.
+        Returns False if there is no data for that month.
+        """
+        if year not in self.data or month not in self.data[year]:
+            return False
+        days = list(range(1, len(self.data[year][month]) + 1))
+        temps = self.data[year][month]
+
+        ax.plot(days, temps, marker='o', linestyle='-', color='b')
+        ax.scatter(days, temps, color='r')
+        ax.set_title(f'Daily Average Temperatures {year}-{month:02}')
+        ax.set_xlabel('Day of Month')
+        ax.set_ylabel('Mean Temperature')
+        ax.set_xticks(days)
+        ax.grid(True)
+        return True
+
+    def plot_boxplot(self, start_year, end_year):
+        """
+        Create a boxplot of mean temperatures from start_year to end_year.
+        """
+        import matplotlib.pyplot as plt
+
+        fig = plt.figure(figsize=BOXPLOT_SIZE)
+        self.draw_boxplot(fig.add_subplot(), start_year, end_year)
+        plt.show()
+
+    def plot_boxplot_summary(self, start_year, end_year):
+        """
+        Create a boxplot from precomputed monthly summaries.
+        """
+        import matplotlib.pyplot as plt
+
+        fig = plt.figure(figsize=BOXPLOT_SIZE)
+        self.draw_boxplot_summary(fig.add_subplot(), start_year, end_year)
         plt.show()
 
     def plot_lineplot(self, year, month):
         """
         Create a line plot of mean temperatures for a specific month and year.
         """
-        if year in self.data and month in self.data[year]:
-            days = list(range(1, len(self.data[year][month]) + 1))
-            temps = self.data[year][month]
-
-            # Create line plot
-            plt.figure(figsize=(10, 9))
-            plt.plot(days, temps, marker='o', linestyle='-', color='b')
-            plt.scatter(days, temps, color='r')
-            plt.title(f'Daily Average Temperatures {year}-{month:02}')
-            plt.xlabel('Day of Month')
-            plt.ylabel('Mean Temperature')
-            plt.xticks(days)
-            plt.grid(True)
+        import matplotlib.pyplot as plt
+
+        fig = plt.figure(figsize=LINEPLOT_SIZE)
+        if self.draw_lineplot(fig.add_subplot(), year, month):
             plt.show()
         else:
+            plt.close(fig)
             print(f"No data available for {year}-{month:02}")
 
+    def boxplot_summary_figure(self, start_year, end_year):
+        """
+        Return a Figure with the summary boxplot, created without pyplot.
+        """
+        fig = Figure(figsize=BOXPLOT_SIZE)
+        self.draw_boxplot_summary(fig.add_subplot(), start_year, end_year)
+        return fig
+
+    def lineplot_figure(self, year, month):
+        """
+        Return a Figure with the line plot, or None if there is no data for that month.
+        """
+        fig = Figure(figsize=LINEPLOT_SIZE)
+        return fig if self.draw_lineplot(fig.add_subplot(), year, month) else None
+
 # def organize_data_for_plotting(data):
 #     organized_data = {}
 #     for entry in data:
@@ -0,0 +1,92 @@
+"""
+Module to cache query results in memory.
+"""
+
+import sys
+import threading
+from collections import OrderedDict
+
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+
+def estimate_size(value):
+    """Roughly estimate the memory held by a query result."""
+    if hasattr(value, "nbytes"):  # NumPy arrays
+        return value.nbytes
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(estimate_size(k) + estimate_size(v) for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        return sys.getsizeof(value) + sum(estimate_size(v) for v in value)
+    return sys.getsizeof(value)
+
+
+class QueryCache:
+    """
+    LRU cache of query results bounded by `max_bytes`.
+
+    Every lookup passes the current data generation of the database; when it
+    differs from the generation the entries were computed at, the whole cache
+    is dropped, so results never outlive a write.
+    """
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()  # key -> (value, size)
+        self.total_bytes = 0
+        self.generation = None
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def check_generation(self, generation):
+        """Drop every entry if the data changed since they were cached."""
+        if generation != self.generation:
+            self.entries.clear()
+            self.total_bytes = 0
+            self.generation = generation
+
+    def get(self, key, generation):
+        """Return a cached value, or None if it is missing or stale."""
+        with self.lock:
+            self.check_generation(generation)
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def find(self, predicate, generation):
+        """
+        Return the first (key, value) whose key satisfies `predicate`, or None.
+        Used to answer a query from a cached result that covers it.
+        """
+        with self.lock:
+            self.check_generation(generation)
+            for key, (value, _) in reversed(self.entries.items()):
+                if predicate(key):
+                    self.entries.move_to_end(key)
+                    self.hits += 1
+                    return key, value
+            return None
+
+    def put(self, key, value, generation):
+        """Cache a value computed at `generation`, evicting the least recently used entries."""
+        size = estimate_size(value)
+        with self.lock:
+            self.check_generation(generation)
+            if size > self.max_bytes:
+                return
+            if key in self.entries:
+                self.total_bytes -= self.entries.pop(key)[1]
+            self.entries[key] = (value, size)
+            self.total_bytes += size
+            while self.total_bytes > self.max_bytes:
+                _, (_, evicted_size) = self.entries.popitem(last=False)
+                self.total_bytes -= evicted_size
+
+    def clear(self):
+        """Drop every entry."""
+        with self.lock:
+            self.entries.clear()
+            self.total_bytes = 0
@@ -0,0 +1,167 @@
+"""
+Module to render many plots to image files without a display.
+
+Charts are rendered with the Agg backend across a process pool. Every worker
+keeps one figure per chart type and clears it between charts instead of
+allocating a new figure each time.
+
+Usage:
+    python render_batch.py spec.json
+    python render_batch.py --stations 27174 --start-year 2020 --end-year 2024 --format svg
+
+A spec file is JSON of the form
+    {"output_dir": "reports", "format": "png",
+     "charts": [{"type": "line", "station": 27174, "year": 2024, "month": 1},
+                {"type": "box", "station": 27174, "start_year": 2020, "end_year": 2024}]}
+"""
+
+import argparse
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+import matplotlib
+matplotlib.use("Agg")
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+from db_operations import DBOperations, DB_NAME, group_by_month, month_bounds
+from plot_operations import PlotOperations, BOXPLOT_SIZE, LINEPLOT_SIZE
+
+FORMATS = ("png", "svg")
+
+_worker = {}
+
+
+def init_worker(db_name):
+    """Open the database and allocate the reusable figures of a worker process."""
+    _worker["db"] = DBOperations(db_name)
+    _worker["figures"] = {}
+    for chart_type, size in (("box", BOXPLOT_SIZE), ("line", LINEPLOT_SIZE)):
+        fig = Figure(figsize=size)
+        FigureCanvasAgg(fig)
+        _worker["figures"][chart_type] = fig
+
+
+def expand_charts(stations, start_year, end_year):
+    """
+    Build chart specs for every month of every year of each station, plus one
+    box plot per station over the whole range.
+    """
+    charts = []
+    for station_id in stations:
+        charts.append({"type": "box", "station": station_id,
+                       "start_year": start_year, "end_year": end_year})
+        for year in range(start_year, end_year + 1):
+            for month in range(1, 13):
+                charts.append({"type": "line", "station": station_id, "year": year, "month": month})
+    return charts
+
+
+def chart_path(chart, output_dir, file_format):
+    """Return the output file of a chart, raising ValueError for an invalid spec."""
+    try:
+        if chart["type"] == "box":
+            name = f"box-{int(chart['start_year'])}-{int(chart['end_year'])}.{file_format}"
+        elif chart["type"] == "line":
+            name = f"line-{int(chart['year'])}-{int(chart['month']):02}.{file_format}"
+        else:
+            raise ValueError(f"Unknown chart type: {chart['type']}")
+        return os.path.join(output_dir, str(int(chart["station"])), name)
+    except (KeyError, TypeError) as e:
+        raise ValueError(f"Invalid chart spec {chart}: missing or bad {e}") from e
+
+
+def render_chart(chart, path):
+    """
+    Render one chart into the worker's reusable figure and save it.
+    Returns the path, or None if there was no data to plot; database errors are raised.
+    """
+    db = _worker["db"]
+    fig = _worker["figures"][chart["type"]]
+    fig.clf()
+    ax = fig.add_subplot()
+
+    if chart["type"] == "box":
+        summary = db.fetch_climate_summary(chart["station"], chart["start_year"], chart["end_year"],
+                                           raise_errors=True)
+        if not summary:
+            return None
+        PlotOperations(summary).draw_boxplot_summary(ax, chart["start_year"], chart["end_year"])
+    else:
+        columns = db.fetch_columns(*month_bounds(chart["year"], chart["month"]), chart["station"],
+                                   raise_errors=True)
+        weather_data = group_by_month(columns["date"], columns["avg_temp"])
+        if not PlotOperations(weather_data).draw_lineplot(ax, chart["year"], chart["month"]):
+            return None
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fig.savefig(path)
+    return path
+
+
+def render_task(task):
+    """Process pool entry point: render a (chart, path) pair, reporting errors instead of raising."""
+    chart, path = task
+    try:
+        return path, render_chart(chart, path), None
+    except Exception as e:
+        return path, None, str(e)
+
+
+def render_all(charts, output_dir, file_format="png", db_name=DB_NAME, processes=None):
+    """
+    Render every chart across a process pool.
+    Returns (rendered, skipped, failed) counts.
+    """
+    if file_format not in FORMATS:
+        raise ValueError(f"Unsupported format: {file_format}")
+    tasks = []
+    rendered = skipped = failed = 0
+    for chart in charts:
+        try:
+            tasks.append((chart, chart_path(chart, output_dir, file_format)))
+        except ValueError as e:
+            print(e)
+            failed += 1
+    chunksize = max(1, len(tasks) // ((processes or os.cpu_count()) * 4))
+    with ProcessPoolExecutor(max_workers=processes, initializer=init_worker,
+                             initargs=(db_name,)) as executor:
+        for path, result, error in executor.map(render_task, tasks, chunksize=chunksize):
+            if error:
+                print(f"Error rendering {path}: {error}")
+                failed += 1
+            elif result is None:
+                skipped += 1
+            else:
+                rendered += 1
+    return rendered, skipped, failed
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Render weather plots to image files.")
+    arg_parser.add_argument("spec", nargs="?", help="JSON chart spec file")
+    arg_parser.add_argument("--stations", type=int, nargs="+", help="render every month of these stations")
+    arg_parser.add_argument("--start-year", type=int, help="first year when using --stations")
+    arg_parser.add_argument("--end-year", type=int, help="last year when using --stations")
+    arg_parser.add_argument("--output-dir", default=None, help="directory for the images (default: reports)")
+    arg_parser.add_argument("--format", choices=FORMATS, default=None, help="image format (default: png)")
+    arg_parser.add_argument("--db", default=DB_NAME, help="database file")
+    arg_parser.add_argument("--processes", type=int, default=None, help="worker processes (default: one per core)")
+    args = arg_parser.parse_args()
+
+    spec = {}
+    if args.spec:
+        with open(args.spec, "r", encoding="utf-8") as f:
+            spec = json.load(f)
+    charts = list(spec.get("charts", []))
+    if args.stations:
+        if args.start_year is None or args.end_year is None:
+            arg_parser.error("--stations needs --start-year and --end-year")
+        charts.extend(expand_charts(args.stations, args.start_year, args.end_year))
+    if not charts:
+        arg_parser.error("nothing to render: give a spec file or --stations")
+
+    output_dir = args.output_dir or spec.get("output_dir", "reports")
+    file_format = args.format or spec.get("format", "png")
+    DBOperations(args.db).initialize_db()  # create or migrate the tables once, before the workers start
+    rendered, skipped, failed = render_all(charts, output_dir, file_format, args.db, args.processes)
+    print(f"Rendered {rendered}, skipped {skipped} without data, failed {failed}.")
@@ -0,0 +1,109 @@
+"""
+Module to re-scrape only the months that have gaps.
+
+The month_coverage index records, for every station and month, which days are
+stored and which were listed with missing values. A repair reads the index,
+picks the closed months of the station's range that miss days (including
+months with no days at all) and scrapes just those again. Each repaired month
+counts an attempt, and months that still miss days after `--max-attempts`
+repairs are left alone: their gaps are most likely in the source data.
+
+Usage:
+    python repair.py                 # every station in the database
+    python repair.py 27174 --dry-run
+"""
+
+import argparse
+from datetime import datetime
+from db_operations import DBOperations
+from metrics import METRICS
+from csv_source import scraper_class, SOURCES
+from scrape_weather import previous_month, DEFAULT_MAX_WORKERS
+
+DEFAULT_MAX_ATTEMPTS = 1
+
+
+def repair_range(db, station_id):
+    """
+    Return the ((year, month), (year, month)) range of closed months to check
+    for a station, or None if nothing is known about it. The station's
+    discovered range is used when there is one, otherwise the months it has
+    coverage for.
+    """
+    now = datetime.now()
+    last_closed = previous_month(now.year, now.month)
+    station_range = db.get_station_range(station_id)
+    if station_range:
+        first, last = station_range[0], station_range[1]
+    else:
+        months = sorted(db.fetch_coverage(station_id))
+        if not months:
+            return None
+        first, last = months[0], months[-1]
+    return first, min(last, last_closed)
+
+
+def repair_station(db, station_id, name, max_attempts=DEFAULT_MAX_ATTEMPTS, dry_run=False,
+                   max_workers=DEFAULT_MAX_WORKERS, source="html"):
+    """
+    Re-scrape the incomplete months of one station from `source` ("html" or "csv").
+    Returns the list of (year, month) pairs that were (or would be) scraped.
+    """
+    bounds = repair_range(db, station_id)
+    if bounds is None:
+        print(f"Station {station_id}: nothing to repair, no data or range is known.")
+        return []
+    incomplete = db.find_incomplete_months(station_id, *bounds, max_attempts=max_attempts)
+    if not incomplete:
+        print(f"Station {station_id}: no gaps from {bounds[0][0]}-{bounds[0][1]:02} "
+              f"to {bounds[1][0]}-{bounds[1][1]:02}.")
+        return []
+
+    missing_days = sum(len(missing) for _, _, missing, _ in incomplete)
+    print(f"Station {station_id}: {len(incomplete)} month(s) with {missing_days} missing day(s).")
+    for year, month, missing, null_days in incomplete:
+        print(f"  {year}-{month:02}: {len(missing)} missing, {len(null_days)} listed without values")
+    months = [(year, month) for year, month, _, _ in incomplete]
+    if dry_run:
+        return months
+
+    scraper = scraper_class(source)(max_workers=max_workers, station_id=station_id, station_name=name)
+    scraper.scrape_months(months, db)
+    attempted = [month for month in months if month not in scraper.failed_months]
+    db.record_repair_attempts(station_id, attempted)
+    METRICS.increment("months_repaired_total", len(attempted))
+
+    still_incomplete = {(year, month) for year, month, _, _ in
+                        db.find_incomplete_months(station_id, *bounds, max_attempts=max_attempts + 1)}
+    filled = len([month for month in attempted if month not in still_incomplete])
+    print(f"Station {station_id}: {filled}/{len(months)} month(s) now complete, "
+          f"{len(scraper.failed_months)} failed to download.")
+    return months
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Re-scrape months with missing days.")
+    arg_parser.add_argument("stations", type=int, nargs="*",
+                            help="station ids (default: every station in the database)")
+    arg_parser.add_argument("--max-attempts", type=int, default=DEFAULT_MAX_ATTEMPTS,
+                            help="skip months already repaired this many times")
+    arg_parser.add_argument("--dry-run", action="store_true", help="list the incomplete months only")
+    arg_parser.add_argument("--workers", type=int, default=DEFAULT_MAX_WORKERS, help="concurrent downloads")
+    arg_parser.add_argument("--source", choices=SOURCES, default="html",
+                            help="download month pages (html) or a bulk CSV file per year (csv)")
+    arg_parser.add_argument("--metrics-json", metavar="PATH", help="write a JSON metrics summary when done")
+    arg_parser.add_argument("--metrics-prom", metavar="PATH",
+                            help="write metrics in the Prometheus text format when done")
+    args = arg_parser.parse_args()
+
+    db = DBOperations()
+    db.initialize_db()
+    stations = db.fetch_stations()
+    for station_id in args.stations or list(stations):
+        repair_station(db, station_id, stations.get(station_id, f"Station {station_id}"),
+                       max_attempts=args.max_attempts, dry_run=args.dry_run, max_workers=args.workers,
+                       source=args.source)
+    if args.metrics_json:
+        METRICS.write_json(args.metrics_json)
+    if args.metrics_prom:
+        METRICS.write_prometheus(args.metrics_prom)
@@ -0,0 +1,190 @@
+"""
+Module to keep scraping reliable against a slow or failing server.
+
+- RetryPolicy retries transient failures with jittered exponential backoff.
+- CircuitBreaker stops sending requests to a host that keeps failing and lets
+  a single probe through after a cool-down.
+- AdaptiveLimiter bounds the requests in flight with AIMD: the limit grows by
+  one per window of healthy responses and is halved on an error or a slow
+  response.
+"""
+
+import http.client
+import random
+import threading
+import time
+from metrics import METRICS
+
+DEFAULT_MAX_ATTEMPTS = 5
+DEFAULT_BASE_DELAY = 0.5
+DEFAULT_MAX_DELAY = 30.0
+DEFAULT_FAILURE_THRESHOLD = 5
+DEFAULT_RESET_TIMEOUT = 30.0
+DEFAULT_LATENCY_TARGET = 5.0
+RETRYABLE_STATUSES = (408, 429, 500, 502, 503, 504)
+
+
+class HTTPStatusError(http.client.HTTPException):
+    """An unexpected HTTP status, with the server's Retry-After hint if it sent one."""
+    def __init__(self, status, url, retry_after=None):
+        super().__init__(f"HTTP {status} for {url}")
+        self.status = status
+        self.retry_after = retry_after
+
+    @property
+    def retryable(self):
+        """Whether the status signals a transient condition."""
+        return self.status in RETRYABLE_STATUSES
+
+
+class CircuitOpenError(http.client.HTTPException):
+    """Raised instead of sending a request to a host whose circuit is open."""
+    def __init__(self, host, retry_in):
+        super().__init__(f"Circuit open for {host}, retrying in {retry_in:.1f}s")
+        self.host = host
+        self.retry_in = retry_in
+
+
+def is_retryable(error):
+    """Whether an error from fetching a page is worth retrying."""
+    if isinstance(error, HTTPStatusError):
+        return error.retryable
+    return isinstance(error, (OSError, http.client.HTTPException))
+
+
+def parse_retry_after(value):
+    """Return the seconds of a numeric Retry-After header, or None."""
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        return None
+
+
+class RetryPolicy:
+    """
+    Retries a callable on transient errors, sleeping a random time between zero
+    and `base_delay * 2**attempt` (capped at `max_delay`) before each retry, or
+    longer when the server or the circuit breaker asked for a pause.
+    """
+    def __init__(self, max_attempts=DEFAULT_MAX_ATTEMPTS, base_delay=DEFAULT_BASE_DELAY,
+                 max_delay=DEFAULT_MAX_DELAY):
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def delay(self, attempt, error=None):
+        """Seconds to wait before retry number `attempt` (starting at 0)."""
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        hint = getattr(error, "retry_after", None) or getattr(error, "retry_in", None)
+        if hint:
+            delay = max(delay, min(hint, self.max_delay) + random.uniform(0, self.base_delay))
+        return delay
+
+    def call(self, func, description="request"):
+        """
+        Call `func()` until it succeeds, a non-retryable error is raised, or the
+        attempts run out, in which case the last error is raised.
+        """
+        for attempt in range(self.max_attempts):
+            try:
+                return func()
+            except Exception as e:
+                if not is_retryable(e) or attempt == self.max_attempts - 1:
+                    raise
+                delay = self.delay(attempt, e)
+                METRICS.increment("retries_total")
+                print(f"Retrying {description} in {delay:.1f}s after: {e}")
+                time.sleep(delay)
+
+
+class CircuitBreaker:
+    """
+    Per-host circuit breaker. After `failure_threshold` consecutive failures the
+    circuit opens and requests fail immediately for `reset_timeout` seconds;
+    then one probe request is let through, which closes the circuit on success
+    or reopens it on failure.
+    """
+    def __init__(self, failure_threshold=DEFAULT_FAILURE_THRESHOLD, reset_timeout=DEFAULT_RESET_TIMEOUT):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.lock = threading.Lock()
+        self.failures = {}  # host -> consecutive failures
+        self.opened_at = {}  # host -> time the circuit opened
+        self.probing = set()  # hosts with a probe request in flight
+
+    def before_request(self, host):
+        """Raise CircuitOpenError unless a request to `host` may be sent now."""
+        with self.lock:
+            opened_at = self.opened_at.get(host)
+            if opened_at is None:
+                return
+            remaining = opened_at + self.reset_timeout - time.monotonic()
+            if remaining > 0 or host in self.probing:
+                raise CircuitOpenError(host, max(remaining, 0.0) or self.reset_timeout / 10)
+            self.probing.add(host)
+
+    def record_success(self, host):
+        """Close the circuit of a host that answered."""
+        with self.lock:
+            self.failures.pop(host, None)
+            self.probing.discard(host)
+            if self.opened_at.pop(host, None) is not None:
+                print(f"Circuit for {host} closed.")
+
+    def record_failure(self, host):
+        """Count a failure, opening (or reopening) the circuit at the threshold."""
+        with self.lock:
+            failures = self.failures[host] = self.failures.get(host, 0) + 1
+            was_probing = host in self.probing
+            self.probing.discard(host)
+            if was_probing or failures >= self.failure_threshold:
+                if host not in self.opened_at or was_probing:
+                    METRICS.increment("circuit_opened_total")
+                    print(f"Circuit for {host} opened after {failures} failure(s).")
+                self.opened_at[host] = time.monotonic()
+
+    def is_open(self, host):
+        """Whether requests to `host` are currently being refused."""
+        with self.lock:
+            return host in self.opened_at
+
+
+class AdaptiveLimiter:
+    """
+    AIMD limit on concurrent requests, between `minimum` and `maximum`.
+
+    Each response that arrives within `latency_target` seconds adds 1/limit to
+    the limit, so it grows by one per window of healthy responses. An error or a
+    slower response halves it, at most once per `latency_target` so that a
+    burst of failures from the same window only counts once.
+    """
+    def __init__(self, initial=4, minimum=1, maximum=32, latency_target=DEFAULT_LATENCY_TARGET):
+        self.minimum = max(1, minimum)
+        self.maximum = max(self.minimum, maximum)
+        self.limit = float(min(max(initial, self.minimum), self.maximum))
+        self.latency_target = latency_target
+        self.in_flight = 0
+        self.last_decrease = 0.0
+        self.condition = threading.Condition()
+
+    def acquire(self):
+        """Block until a request slot is free and take it."""
+        with self.condition:
+            while self.in_flight >= int(self.limit):
+                self.condition.wait()
+            self.in_flight += 1
+
+    def release(self, latency, ok):
+        """Give a slot back and adjust the limit from the request's outcome."""
+        with self.condition:
+            self.in_flight -= 1
+            healthy = ok and latency <= self.latency_target
+            if healthy:
+                self.limit = min(self.maximum, self.limit + 1.0 / self.limit)
+            else:
+                now = time.monotonic()
+                if now - self.last_decrease >= self.latency_target:
+                    self.last_decrease = now
+                    self.limit = max(self.minimum, self.limit / 2)
+            METRICS.increment("limiter_responses_total", healthy=healthy)
+            self.condition.notify_all()
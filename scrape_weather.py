@@ -3,16 +3,93 @@ Module to scrape weather data from the Government of Canada's website.
 """
 
 from html.parser import HTMLParser
-import urllib.request
-from datetime import datetime
+import codecs
+import threading
+import time
+from urllib.parse import urlparse
+from datetime import datetime, timedelta
 from concurrent.futures import ThreadPoolExecutor, as_completed
-from db_operations import DBOperations
+from db_operations import DBOperations, DEFAULT_STATION_ID, DEFAULT_STATION_NAME
+from db_writer import BulkWriter
+from http_session import HTTPSession
+from metrics import METRICS
+from page_cache import PageCache
+from resilience import (AdaptiveLimiter, CircuitBreaker, HTTPStatusError, RetryPolicy, RETRYABLE_STATUSES,
+                        is_retryable, parse_retry_after)
 
-class WeatherScraper(HTMLParser):
+BASE_URL = "http://climate.weather.gc.ca/climate_data/daily_data_e.html"
+FIRST_RECORD_YEAR = 1840  # no station on the site has daily data before this year
+RANGE_MAX_AGE = timedelta(days=1)  # rediscover the latest month after this long
+
+DEFAULT_MAX_WORKERS = 8
+DEFAULT_REQUESTS_PER_SECOND = 4.0
+
+
+def previous_month(year, month):
+    """Return the (year, month) before the given month."""
+    return (year - 1, 12) if month == 1 else (year, month - 1)
+
+
+def next_month(year, month):
+    """Return the (year, month) after the given month."""
+    return (year + 1, 1) if month == 12 else (year, month + 1)
+
+
+def month_index(year, month):
+    """Number a (year, month) pair so consecutive months differ by one."""
+    return year * 12 + month - 1
+
+
+def month_from_index(index):
+    """Turn a month_index back into a (year, month) pair."""
+    return index // 12, index % 12 + 1
+
+
+def month_range(start, end):
+    """List the (year, month) pairs from `start` to `end`, both inclusive."""
+    months = []
+    current = start
+    while current <= end:
+        months.append(current)
+        current = next_month(*current)
+    return months
+
+
+class RateLimiter:
     """
-    Class to scrape weather data from the Government of Canada's website.
+    Thread-safe limiter that spaces out requests to the same host.
+    """
+    def __init__(self, requests_per_second=DEFAULT_REQUESTS_PER_SECOND):
+        self.interval = 1.0 / requests_per_second if requests_per_second else 0.0
+        self.lock = threading.Lock()
+        self.next_slot = {}
+
+    def reserve(self, host):
+        """
+        Reserve the next request slot for a host and return how long to wait for it.
+        """
+        with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next_slot.get(host, now))
+            self.next_slot[host] = slot + self.interval
+        return slot - now
+
+    def wait(self, host):
+        """Block the calling thread until the host's next slot is reached."""
+        delay = self.reserve(host)
+        if delay > 0:
+            time.sleep(delay)
+
+
+class MonthParser(HTMLParser):
+    """
+    Parser for a single month of the daily data page.
+    Each month gets its own instance so months can be parsed concurrently.
+
+    Raw bytes can be fed as they arrive with `feed_bytes`, which reports when
+    the daily data table has closed and the rest of the page can be skipped.
     """
-    def __init__(self):
+    def __init__(self, year, month):
         super().__init__()
         self.weather = {}  # store the scraped weather data for the month
         self.recording_row = False
@@ -20,15 +97,19 @@ class WeatherScraper(HTMLParser):
         self.current_date = None
         self.current_temp = []
         self.col_index = 0
-        self.year = None
-        self.month = None
+        self.year = year
+        self.month = month
         self.tr_found = False  # detect if there are any <tr> tags
         self.has_previous_month = False  # check for the "Previous Month" link
+        self.table_closed = False  # the table with the daily rows has ended
+        self.decoder = codecs.getincrementaldecoder('utf-8')()
+        self.pending_text = []  # text since the last tag, which may arrive in pieces
 
     def handle_starttag(self, tag, attrs):
         """
         Handle the start tag of an HTML element.
         """
+        self.flush_text()
         if tag == 'tr':  # Start of a table row
             self.recording_row = True
             self.current_date = None
@@ -40,16 +121,28 @@ class WeatherScraper(HTMLParser):
             self.col_index += 1
         elif tag == 'th' and self.recording_row and self.col_index == 0:  # Date column
             self.recording_cell = True
-        elif tag == 'ul' and ('pager' in str(attrs) or 'pagination' in str(attrs)):
-            # Look for the 'Previous Month' link
-            for attr in attrs:
-                if 'Previous Month' in str(attr):
+        elif not self.has_previous_month:
+            # The 'Previous Month' link or button may carry its label in an attribute
+            for _, value in attrs:
+                if value and 'Previous Month' in value:
                     self.has_previous_month = True
 
     def handle_data(self, data):
         """
-        Handle the data within an HTML element.
+        Collect the data within an HTML element. When the page is fed in chunks,
+        the text between two tags can be split across calls, so it is only
+        interpreted once the next tag starts.
         """
+        self.pending_text.append(data)
+
+    def flush_text(self):
+        """Interpret the text collected since the last tag."""
+        if not self.pending_text:
+            return
+        data = "".join(self.pending_text)
+        self.pending_text = []
+        if not self.has_previous_month and 'Previous Month' in data:
+            self.has_previous_month = True
         if self.recording_row and self.recording_cell:
             clean_data = data.strip()
 
@@ -72,8 +165,11 @@ class WeatherScraper(HTMLParser):
         """
         Handle the end tag of an HTML element.
         """
+        self.flush_text()
         if tag in ('td', 'th'):  # End of cell
             self.recording_cell = False
+        elif tag == 'table' and self.weather:  # End of the table with the daily rows
+            self.table_closed = True
         elif tag == 'tr':  # End of row
             if self.current_date and len(self.current_temp) == 3:
                 self.weather[self.current_date] = {
@@ -83,81 +179,391 @@ class WeatherScraper(HTMLParser):
                 }
             self.recording_row = False
 
-    def scrape_all_days(self, year, month):
-        """Scrape data for all days in a specific month."""
-        weather = {}  # Clear previous month's data
-        self.year = year
-        self.month = month
-        url = f"http://climate.weather.gc.ca/climate_data/daily_data_e.html?StationID=27174&timeframe=2&Year={year}&Month={month}"
-        print(f"Scraping data for {year}-{month:02}...")
-        try:
-            with urllib.request.urlopen(url) as response:
-                html = response.read().decode('utf-8')
+    def feed_bytes(self, chunk):
+        """
+        Decode and parse the next chunk of the raw page.
+        Returns False once the daily data table has closed and no more input is needed.
+        """
+        self.feed(self.decoder.decode(chunk))
+        return not self.table_closed
+
+    def finish(self):
+        """Parse whatever is still buffered after the last chunk."""
+        self.feed(self.decoder.decode(b"", final=True))
+        self.close()
+        self.flush_text()
+        return self.weather
+
+
+def parse_month(body, year, month):
+    """
+    Parse a raw month page into a dictionary of days.
+    A plain function so it can run in a process pool.
+    """
+    parser = MonthParser(year, month)
+    parser.feed_bytes(body)
+    return parser.finish()
+
+
+class WeatherScraper:
+    """
+    Class to scrape weather data from the Government of Canada's website.
+
+    Months are fetched concurrently on a thread pool, with at most
+    `max_workers` requests in flight and a per-host rate limit of
+    `requests_per_second`.
+
+    Requests go through a keep-alive `session` and raw pages are kept in a
+    `cache` that is revalidated with conditional requests (pass `cache=False`
+    to disable it). With `offline` set, cached pages are used without
+    contacting the server at all.
+
+    Every scraped day is printed only when `verbose` is set; otherwise one
+    line per month is printed. Timings and counts go to `metrics.METRICS`.
+
+    Transient failures are retried with backoff (`retry`), a host that keeps
+    failing is paused by a circuit `breaker`, and the requests in flight are
+    bounded by an AIMD `limiter` that never exceeds `max_workers`. Months that
+    still fail are listed in `failed_months` after scrape_months.
+    """
+    def __init__(self, max_workers=DEFAULT_MAX_WORKERS,
+                 requests_per_second=DEFAULT_REQUESTS_PER_SECOND,
+                 session=None, cache=None, offline=False,
+                 station_id=DEFAULT_STATION_ID, station_name=DEFAULT_STATION_NAME, rate_limiter=None,
+                 verbose=False, retry=None, breaker=None, limiter=None):
+        self.max_workers = max(1, max_workers)
+        self.rate_limiter = rate_limiter if rate_limiter is not None else RateLimiter(requests_per_second)
+        self.session = session if session is not None else HTTPSession()
+        self.cache = cache if cache is not None else PageCache()
+        self.offline = offline
+        self.station_id = station_id
+        self.station_name = station_name
+        self.base_url = BASE_URL
+        self.verbose = verbose
+        self.retry = retry if retry is not None else RetryPolicy()
+        self.breaker = breaker if breaker is not None else CircuitBreaker()
+        self.limiter = limiter if limiter is not None else AdaptiveLimiter(
+            initial=max(1, self.max_workers // 2), maximum=self.max_workers)
+        self.failed_months = {}
+        self.probed = {}  # months fetched during range discovery, reused when scraping
 
-            # Check if there is a link to the "Previous Month" page
-            if 'Previous Month' not in html:
-                self.has_previous_month = False
-                print(f"No 'Previous Month' link for {year}-{month:02}. No more data to scrape.")
+    def month_url(self, year, month):
+        """Build the daily data URL for a specific month."""
+        return f"{self.base_url}?StationID={self.station_id}&timeframe=2&Year={year}&Month={month}"
+
+    def fetch_month_html(self, year, month, on_chunk=None):
+        """
+        Fetch the raw page for a month, reusing the cached copy when the server
+        reports it unchanged. Returns None when offline and the page is not cached.
+
+        With `on_chunk`, the page is passed to it while it downloads (or all at
+        once when it comes from the cache) and the download stops when it
+        returns False. The cache then keeps the page only up to that point,
+        marked as partial, and the page is only kept in memory when it is
+        cached: without a cache, b"" is returned for a downloaded page.
+        """
+        cached = self.cache.get(self.station_id, year, month) if self.cache else None
+        if self.offline:
+            METRICS.increment("page_cache_requests_total", result="hit" if cached else "miss")
+            if cached and on_chunk is not None:
+                on_chunk(cached.body)
+            return cached.body if cached else None
+
+        url = self.month_url(year, month)
+        response = self.request(url, cached.conditional_headers() if cached else {}, on_chunk,
+                                keep_body=on_chunk is None or bool(self.cache))
+        if response.status == 304 and cached is not None:
+            METRICS.increment("page_cache_requests_total", result="revalidated")
+            self.cache.touch(self.station_id, year, month)
+            if on_chunk is not None:
+                on_chunk(cached.body)
+            return cached.body
+        if response.status != 200:
+            raise HTTPStatusError(response.status, url, parse_retry_after(response.headers.get("Retry-After")))
+        if self.cache:
+            self.cache.put(self.station_id, year, month, response.body, response.headers.get("ETag"),
+                           response.headers.get("Last-Modified"), partial=not response.complete)
+        return response.body
+
+    def request(self, url, headers=None, on_chunk=None, keep_body=True):
+        """
+        Send one GET through the circuit breaker, the concurrency limit and the
+        rate limit, and record its metrics. Returns the Response, whatever its status.
+        """
+        host = urlparse(url).netloc
+        self.breaker.before_request(host)
+        self.limiter.acquire()
+        ok = False
+        started = time.perf_counter()
+        try:
+            self.rate_limiter.wait(host)
+            started = time.perf_counter()
+            response = self.session.get(url, headers, on_chunk, keep_body)
+            ok = response.status not in RETRYABLE_STATUSES
+        except Exception as e:
+            ok = not is_retryable(e)
+            raise
+        finally:
+            latency = time.perf_counter() - started
+            self.limiter.release(latency, ok)
+            if ok:
+                self.breaker.record_success(host)
             else:
-                self.has_previous_month = True
+                self.breaker.record_failure(host)
+        METRICS.observe("http_request_seconds", latency)
+        METRICS.increment("http_responses_total", status=response.status)
+        METRICS.increment("http_bytes_total", response.length)
+        if not response.complete:
+            METRICS.increment("http_truncated_total")
+        return response
 
-            self.feed(html)
+    def scrape_all_days(self, year, month):
+        """
+        Scrape data for all days in a specific month.
+        The page is parsed while it downloads and reading stops after the data table.
+        Transient errors are retried; if the month still fails, the error is raised.
+        """
+        if self.verbose:
+            print(f"Scraping data for {year}-{month:02}...")
+        started = time.perf_counter()
+
+        def attempt():
+            # Every attempt starts a fresh parser, since a failed one may have seen part of the page
+            parser = MonthParser(year, month)
+            parse_seconds = [0.0]
+            parsed_bytes = [0]
 
-            # Copy the scraped data to the local dictionary
-            weather.update(self.weather)
-            self.weather.clear()  # Clear the shared dictionary for the next use
+            def parse_chunk(chunk):
+                chunk_started = time.perf_counter()
+                more = parser.feed_bytes(chunk)
+                parse_seconds[0] += time.perf_counter() - chunk_started
+                parsed_bytes[0] += len(chunk)
+                return more
 
-            # Return all days of scraped data in dictionary format
-            return weather
+            body = self.fetch_month_html(year, month, parse_chunk)
+            if body is not None:
+                parser.finish()
+            return body, parser, parse_seconds[0], parsed_bytes[0]
 
+        try:
+            body, parser, parse_seconds, parsed_bytes = self.retry.call(attempt, f"{year}-{month:02}")
         except Exception as e:
+            METRICS.increment("months_failed_total")
             print(f"Error fetching data for {year}-{month:02}: {e}")
+            raise
+        if body is None:
+            print(f"No cached page for {year}-{month:02} in offline mode.")
             return {}
+        finished = time.perf_counter()
+
+        # Check if there is a link to the "Previous Month" page
+        if not parser.has_previous_month:
+            print(f"No 'Previous Month' link for {year}-{month:02}. No more data to scrape.")
+
+        METRICS.observe("fetch_seconds", finished - started - parse_seconds)
+        METRICS.observe("parse_seconds", parse_seconds)
+        METRICS.increment("rows_parsed_total", len(parser.weather))
+        METRICS.record("month", station_id=self.station_id, year=year, month=month,
+                       fetch_seconds=finished - started - parse_seconds, bytes=parsed_bytes,
+                       parse_seconds=parse_seconds, rows_parsed=len(parser.weather))
+
+        # Return all days of scraped data in dictionary format
+        return parser.weather
 
-    def scrape_backwards(self, start_year, start_month):
+    def month_has_data(self, index):
         """
-        Scrapes data backwards from the current date.
+        Probe whether the month at `index` has any daily data. The parsed month
+        is kept so scraping it later does not request the page again.
         """
-        current_month = start_month
-        current_year = start_year
-        db = DBOperations()
-        tasks = []
+        month = month_from_index(index)
+        if month not in self.probed:
+            METRICS.increment("range_probes_total")
+            self.probed[month] = self.scrape_all_days(*month)
+        return bool(self.probed[month])
 
-        with ThreadPoolExecutor(max_workers=1) as executor:
-            while True:
-                # Check if the date is earlier than the earliest available data
-                if current_year < 2020 or (current_year == 2020 and current_month < 1):
-                    print("No more data available. Earliest date reached.")
-                    break
+    def find_latest_month(self, upper, known=None):
+        """
+        Find the latest month with data at or before `upper` (a month index).
+        `known` is a month index already known to have data, if any. Probes
+        back from `upper` in exponentially growing steps until a month with
+        data is found, then binary searches the gap. Returns None without data.
+        """
+        if self.month_has_data(upper):
+            return upper
+        empty, step = upper, 1
+        floor = month_index(FIRST_RECORD_YEAR, 1)
+        while known is None or known < empty - step:
+            probe = max(empty - step, floor)
+            if self.month_has_data(probe):
+                known = probe
+                break
+            if probe == floor:
+                return None
+            empty, step = probe, step * 2
+        while empty - known > 1:
+            middle = (known + empty) // 2
+            if self.month_has_data(middle):
+                known = middle
+            else:
+                empty = middle
+        return known
 
-                tasks.append(executor.submit(self.scrape_and_save, current_year, current_month, db))
+    def find_earliest_month(self, known):
+        """
+        Find the earliest month with data, given the month index `known` that has
+        data. Probes back in exponentially growing steps until an empty month,
+        then binary searches the gap. Assumes the record has no gaps of a month
+        or more that happen to fall on a probe.
+        """
+        floor = month_index(FIRST_RECORD_YEAR, 1)
+        empty, step = None, 1
+        while known > floor:
+            probe = max(known - step, floor)
+            if not self.month_has_data(probe):
+                empty = probe
+                break
+            known, step = probe, step * 2
+        if empty is None:
+            return known
+        while known - empty > 1:
+            middle = (known + empty) // 2
+            if self.month_has_data(middle):
+                known = middle
+            else:
+                empty = middle
+        return known
+
+    def discover_range(self, db=None, refresh=False):
+        """
+        Return the ((year, month), (year, month)) range of months with data for
+        the station, or None if it has none. The range is cached in the database;
+        the earliest month is kept, and the latest is rediscovered once the
+        cached range is older than RANGE_MAX_AGE (or with `refresh`).
+        """
+        if db is None:
+            db = DBOperations()
+        now = datetime.now()
+        cached = db.get_station_range(self.station_id)
+        if cached and not refresh and now - cached[2] < RANGE_MAX_AGE:
+            return cached[0], cached[1]
+
+        print(f"Discovering the range of available data for station {self.station_id}...")
+        probed_before = set(self.probed)
+        upper = month_index(now.year, now.month)
+        if cached:
+            latest = self.find_latest_month(upper, known=month_index(*cached[1]))
+            earliest = month_index(*cached[0])
+        else:
+            latest = self.find_latest_month(upper)
+            if latest is None:
+                print(f"No data found for station {self.station_id}.")
+                return None
+            earliest = self.find_earliest_month(latest)
+        first, last = month_from_index(earliest), month_from_index(latest)
+        db.set_station_range(self.station_id, first, last)
+        print(f"Station {self.station_id} has data from {first[0]}-{first[1]:02} "
+              f"to {last[0]}-{last[1]:02} ({len(set(self.probed) - probed_before)} page(s) probed).")
+        return first, last
+
+    def scrape_backwards(self, start_year, start_month, db=None, progress=None, cancel_event=None):
+        """
+        Scrapes data backwards from the given month to the earliest month with data,
+        as found by discover_range.
+        """
+        if db is None:
+            db = DBOperations()
+        data_range = self.discover_range(db)
+        if data_range is None:
+            return {}
+        first, last = data_range
+        months = list(reversed(month_range(first, min((start_year, start_month), last))))
+        print("Scraping back to the earliest available data.")
+        return self.scrape_months(months, db, progress, cancel_event)
+
+    def scrape_forward(self, start, end, db=None, progress=None, cancel_event=None):
+        """
+        Scrapes the months from `start` to `end` (inclusive (year, month) pairs).
+        """
+        return self.scrape_months(month_range(start, end), db, progress, cancel_event)
+
+    def scrape_months(self, months, db=None, progress=None, cancel_event=None):
+        """
+        Scrape and save a list of (year, month) pairs on a pool of `max_workers` threads.
+        All workers hand their rows to one BulkWriter thread.
+
+        `progress(months_done, months_total, rows_written)` is called after each
+        month. Once `cancel_event` is set, months that have not started are skipped.
+        Returns a dictionary mapping each month to the number of days scraped,
+        or None for skipped and failed months; failures are kept in `failed_months`.
+        """
+        if db is None:
+            db = DBOperations()
+        db.add_station(self.station_id, self.station_name)
+        lock = threading.Lock()
+        done = [0]
+        self.failed_months = {}
 
-                # Move to the previous month
-                current_month -= 1
-                if current_month == 0:
-                    current_month = 12
-                    current_year -= 1
+        with BulkWriter(db) as writer:
+            def scrape_month(year, month):
+                if cancel_event is not None and cancel_event.is_set():
+                    return None
+                try:
+                    count = self.scrape_and_save(year, month, writer)
+                except Exception as e:
+                    with lock:
+                        self.failed_months[(year, month)] = str(e)
+                    count = None
+                if progress is not None:
+                    with lock:
+                        done[0] += 1
+                        months_done = done[0]
+                    progress(months_done, len(months), writer.rows_written)
+                return count
 
-            for task in as_completed(tasks):
-                task.result()
+            def scrape_group(group):
+                return {(year, month): scrape_month(year, month) for year, month in group}
+
+            groups = self.month_groups(months)
+            results = {}
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                tasks = [executor.submit(scrape_group, group) for group in groups]
+                for task in as_completed(tasks):
+                    results.update(task.result())
+
+        if self.failed_months:
+            failed = ", ".join(f"{year}-{month:02}" for year, month in sorted(self.failed_months))
+            print(f"{len(self.failed_months)} month(s) failed and were not saved: {failed}")
+        return results
+
+    def month_groups(self, months):
+        """
+        Split `months` into the units of work handed to one worker, which scrapes
+        the months of a unit in order. Every month is its own unit here.
+        """
+        return [[month] for month in months]
 
     def scrape_and_save(self, year, month, db):
         """
         Scrape weather data for a specific month and save it to the database.
+        Returns the number of days scraped.
         """
-        scraped_weather = self.scrape_all_days(year, month)
+        scraped_weather = self.probed.pop((year, month), None)
+        if scraped_weather is None:
+            scraped_weather = self.scrape_all_days(year, month)
 
         # Check if data is available
         if scraped_weather:
-            print(f"\nScraped Weather Data for {year}-{month:02}:")
-            for date, temps in scraped_weather.items():
-                print(f"Day: {date} -> Max: {temps['Max']}, Min: {temps['Min']}, Mean: {temps['Mean']}°C")
-            print(f"Total days scraped for {year}-{month:02}: {len(scraped_weather)}\n")
+            if self.verbose:
+                print(f"\nScraped Weather Data for {year}-{month:02}:")
+                for date, temps in scraped_weather.items():
+                    print(f"Day: {date} -> Max: {temps['Max']}, Min: {temps['Min']}, Mean: {temps['Mean']}°C")
+            print(f"Total days scraped for {year}-{month:02}: {len(scraped_weather)}")
 
             # Save the scraped data to the database
-            db.save_data(scraped_weather)
+            db.save_data(scraped_weather, self.station_id)
         else:
             print(f"No data available for {year}-{month:02}. Moving to the next month.")
+        return len(scraped_weather)
 
 if __name__ == "__main__":
     now = datetime.now()
@@ -165,5 +571,5 @@ if __name__ == "__main__":
     current_month = now.month
 
     # Testing to see auto stopping of no more data (not working yet)
-    scraper = WeatherScraper()
+    scraper = WeatherScraper(verbose=True)
     scraper.scrape_backwards(current_year, current_month)
@@ -0,0 +1,377 @@
+"""
+Module to serve the weather data over HTTP.
+
+A small asyncio HTTP/1.1 server exposes range queries and summaries as JSON
+and rendered plots as PNG. The event loop only parses requests and writes
+responses: queries and rendering run on a thread pool, where every thread
+has its own pooled connection, so several readers query the WAL database at
+once while a write is committing.
+
+Responses are cached in memory and carry an ETag built from the database's
+data version, so a client revalidating with If-None-Match gets a 304 until the
+data changes, and the cache is dropped as soon as it does. A background task
+runs the incremental update every `--update-interval` seconds.
+
+Endpoints (all GET, `station` defaults to the default station):
+    /stations
+    /samples?station=27174&start=2024-01-01&end=2024-12-31
+    /summary?station=27174&start_year=2000&end_year=2020    (per calendar month)
+    /monthly?station=27174&start_year=2000&end_year=2020    (per year and month)
+    /plot/line.png?station=27174&year=2024&month=1
+    /plot/box.png?station=27174&start_year=2000&end_year=2020
+    /metrics                                                (Prometheus text)
+    /health
+
+Usage:
+    python server.py --port 8080 --update-interval 3600
+"""
+
+import argparse
+import asyncio
+import io
+import json
+import math
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from email.utils import formatdate
+from urllib.parse import parse_qsl, urlsplit
+from db_operations import DBOperations, DB_NAME, DEFAULT_STATION_ID, group_by_month, month_bounds
+from metrics import METRICS
+from query_cache import QueryCache
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8080
+DEFAULT_READERS = 8
+DEFAULT_UPDATE_INTERVAL = 3600.0
+DEFAULT_CACHE_BYTES = 64 * 1024 * 1024
+IDLE_TIMEOUT = 30.0
+MAX_HEADER_BYTES = 16 * 1024
+
+REASONS = {200: "OK", 304: "Not Modified", 400: "Bad Request", 404: "Not Found",
+           405: "Method Not Allowed", 500: "Internal Server Error"}
+JSON_TYPE = "application/json"
+PNG_TYPE = "image/png"
+UNCACHED_PATHS = ("/metrics", "/health")
+
+
+class HTTPError(Exception):
+    """An error response with a status code and a message for the client."""
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def to_json(value):
+    """Encode a response body, turning NaN into null."""
+    def clean(item):
+        if isinstance(item, float) and math.isnan(item):
+            return None
+        if isinstance(item, dict):
+            return {str(key): clean(child) for key, child in item.items()}
+        if isinstance(item, (list, tuple)):
+            return [clean(child) for child in item]
+        return item
+    return json.dumps(clean(value), separators=(",", ":")).encode("utf-8")
+
+
+def int_param(params, name, default=None):
+    """Read an integer query parameter, raising a 400 if it is missing or invalid."""
+    value = params.get(name)
+    if value is None:
+        if default is None:
+            raise HTTPError(400, f"Missing parameter: {name}")
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        raise HTTPError(400, f"Invalid {name}: {value}") from None
+
+
+class WeatherServer:
+    """
+    Query and plot server over one database. Read handlers run on `readers`
+    threads; rendering is serialized because Matplotlib is not thread-safe.
+    """
+    def __init__(self, db_name=DB_NAME, readers=DEFAULT_READERS, cache_bytes=DEFAULT_CACHE_BYTES,
+                 update_interval=DEFAULT_UPDATE_INTERVAL, source="html"):
+        self.db = DBOperations(db_name)
+        self.executor = ThreadPoolExecutor(max_workers=readers, thread_name_prefix="reader")
+        self.cache = QueryCache(cache_bytes)
+        self.update_interval = update_interval
+        self.source = source
+        self.render_lock = threading.Lock()
+        self.instance = format(int(time.time()), "x")  # keeps ETags from colliding across restarts
+        self.routes = {
+            "/stations": self.get_stations,
+            "/samples": self.get_samples,
+            "/summary": self.get_summary,
+            "/monthly": self.get_monthly,
+            "/plot/line.png": self.get_line_plot,
+            "/plot/box.png": self.get_box_plot,
+            "/metrics": self.get_metrics,
+            "/health": self.get_health,
+        }
+        self.server = None
+        self.update_task = None
+
+    def etag(self, key, version):
+        """Build the ETag of a response from its request and the data version."""
+        digest = zlib.crc32(repr(key).encode("utf-8"))
+        return f'"{self.instance}-{version}-{digest:08x}"'
+
+    # Handlers run on the reader threads and return (content type, body).
+
+    def get_stations(self, params):
+        """List the stations."""
+        stations = self.db.fetch_stations()
+        return JSON_TYPE, to_json({"stations": [{"id": station_id, "name": name}
+                                                for station_id, name in stations.items()]})
+
+    def get_samples(self, params):
+        """Daily samples of a station, optionally between `start` and `end` (YYYY-MM-DD)."""
+        station_id = int_param(params, "station", DEFAULT_STATION_ID)
+        start, end = params.get("start"), params.get("end")
+        if bool(start) != bool(end):
+            raise HTTPError(400, "Pass both start and end, or neither")
+        try:
+            if start:
+                date.fromisoformat(start), date.fromisoformat(end)
+        except ValueError as e:
+            raise HTTPError(400, f"Invalid date: {e}") from None
+        columns = self.db.fetch_columns(start, end, station_id)
+        return JSON_TYPE, to_json({
+            "station": station_id,
+            "date": columns["date"].astype(str).tolist(),
+            "min_temp": columns["min_temp"].tolist(),
+            "max_temp": columns["max_temp"].tolist(),
+            "avg_temp": columns["avg_temp"].tolist(),
+        })
+
+    def year_range(self, params):
+        """Read the station and year range of a summary request."""
+        station_id = int_param(params, "station", DEFAULT_STATION_ID)
+        start_year, end_year = int_param(params, "start_year"), int_param(params, "end_year")
+        if start_year > end_year:
+            raise HTTPError(400, "start_year is after end_year")
+        return station_id, start_year, end_year
+
+    def get_summary(self, params):
+        """Per-calendar-month summary of a range of years."""
+        station_id, start_year, end_year = self.year_range(params)
+        summary = self.db.fetch_climate_summary(station_id, start_year, end_year)
+        return JSON_TYPE, to_json({"station": station_id, "start_year": start_year, "end_year": end_year,
+                                   "months": summary})
+
+    def get_monthly(self, params):
+        """Summary of every month in a range of years."""
+        station_id, start_year, end_year = self.year_range(params)
+        summary = self.db.fetch_monthly_summary(station_id, start_year, end_year)
+        return JSON_TYPE, to_json({"station": station_id,
+                                   "months": {f"{year}-{month:02}": value
+                                              for (year, month), value in summary.items()}})
+
+    def render(self, fig):
+        """Rasterize a Figure to PNG bytes."""
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+        with self.render_lock, METRICS.timer("server_render_seconds"):
+            FigureCanvasAgg(fig)
+            output = io.BytesIO()
+            fig.savefig(output, format="png")
+        return PNG_TYPE, output.getvalue()
+
+    def get_line_plot(self, params):
+        """Line plot of the daily mean temperatures of a month."""
+        from plot_operations import PlotOperations
+
+        station_id = int_param(params, "station", DEFAULT_STATION_ID)
+        year, month = int_param(params, "year"), int_param(params, "month")
+        if not 1 <= month <= 12:
+            raise HTTPError(400, f"Invalid month: {month}")
+        columns = self.db.fetch_columns(*month_bounds(year, month), station_id)
+        fig = PlotOperations(group_by_month(columns["date"], columns["avg_temp"])).lineplot_figure(year, month)
+        if fig is None:
+            raise HTTPError(404, f"No data for {year}-{month:02}")
+        return self.render(fig)
+
+    def get_box_plot(self, params):
+        """Box plot of the monthly distributions over a range of years."""
+        from plot_operations import PlotOperations
+
+        station_id, start_year, end_year = self.year_range(params)
+        summary = self.db.fetch_climate_summary(station_id, start_year, end_year)
+        if not summary:
+            raise HTTPError(404, f"No data for {start_year} to {end_year}")
+        return self.render(PlotOperations(summary).boxplot_summary_figure(start_year, end_year))
+
+    def get_metrics(self, params):
+        """The collected metrics in the Prometheus text format."""
+        return "text/plain; version=0.0.4", METRICS.to_prometheus().encode("utf-8")
+
+    def get_health(self, params):
+        """Liveness and the current data version."""
+        return JSON_TYPE, to_json({"status": "ok", "data_version": self.db.data_generation(),
+                                   "cache_hits": self.cache.hits, "cache_misses": self.cache.misses})
+
+    async def respond(self, method, target, headers):
+        """
+        Produce (status, headers, body) for a request: from the cache or a 304
+        when possible, otherwise by running the handler on a reader thread.
+        """
+        if method not in ("GET", "HEAD"):
+            raise HTTPError(405, f"Method not allowed: {method}")
+        url = urlsplit(target)
+        handler = self.routes.get(url.path)
+        if handler is None:
+            raise HTTPError(404, f"Not found: {url.path}")
+        params = dict(parse_qsl(url.query))
+        if url.path in UNCACHED_PATHS:
+            content_type, body = await asyncio.get_running_loop().run_in_executor(self.executor, handler, params)
+            return 200, {"Content-Type": content_type, "Cache-Control": "no-store"}, body
+
+        key = (url.path, tuple(sorted(params.items())))
+        version = self.db.data_generation()
+        etag = self.etag(key, version)
+        response_headers = {"ETag": etag, "Cache-Control": "no-cache"}
+        if headers.get("if-none-match") == etag:
+            METRICS.increment("server_cache_requests_total", result="not_modified")
+            return 304, response_headers, b""
+        cached = self.cache.get(key, version)
+        if cached is None:
+            METRICS.increment("server_cache_requests_total", result="miss")
+            cached = await asyncio.get_running_loop().run_in_executor(self.executor, handler, params)
+            self.cache.put(key, cached, version)
+        else:
+            METRICS.increment("server_cache_requests_total", result="hit")
+        content_type, body = cached
+        response_headers["Content-Type"] = content_type
+        return 200, response_headers, body
+
+    async def handle_connection(self, reader, writer):
+        """Serve the requests of one keep-alive connection."""
+        try:
+            while True:
+                try:
+                    head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), IDLE_TIMEOUT)
+                except (asyncio.IncompleteReadError, asyncio.TimeoutError, ConnectionError):
+                    break
+                except asyncio.LimitOverrunError:
+                    await self.write_response(writer, 400, {}, to_json({"error": "Headers too large"}), False)
+                    break
+                lines = head.decode("iso-8859-1").split("\r\n")
+                try:
+                    method, target, version = lines[0].split(" ")
+                except ValueError:
+                    await self.write_response(writer, 400, {}, to_json({"error": "Malformed request"}), False)
+                    break
+                headers = {}
+                for line in lines[1:]:
+                    name, _, value = line.partition(":")
+                    if name:
+                        headers[name.strip().lower()] = value.strip()
+                connection = headers.get("connection", "").lower()
+                keep_alive = connection != "close" and (version == "HTTP/1.1" or connection == "keep-alive")
+
+                started = time.perf_counter()
+                try:
+                    status, response_headers, body = await self.respond(method, target, headers)
+                except HTTPError as e:
+                    status, response_headers, body = e.status, {"Content-Type": JSON_TYPE}, to_json({"error": str(e)})
+                except Exception as e:
+                    print("Error serving request:", e)
+                    status, response_headers, body = 500, {"Content-Type": JSON_TYPE}, to_json({"error": "Internal error"})
+                path = urlsplit(target).path
+                METRICS.observe("server_request_seconds", time.perf_counter() - started,
+                                path=path if path in self.routes else "other")
+                METRICS.increment("server_responses_total", status=status)
+                await self.write_response(writer, status, response_headers,
+                                          b"" if method == "HEAD" else body, keep_alive,
+                                          content_length=len(body))
+                if not keep_alive:
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+
+    async def write_response(self, writer, status, headers, body, keep_alive, content_length=None):
+        """Write a response head and body."""
+        head = [f"HTTP/1.1 {status} {REASONS.get(status, 'Unknown')}",
+                f"Date: {formatdate(usegmt=True)}",
+                f"Content-Length: {len(body) if content_length is None or status == 304 else content_length}",
+                f"Connection: {'keep-alive' if keep_alive else 'close'}"]
+        head += [f"{name}: {value}" for name, value in headers.items()]
+        writer.write(("\r\n".join(head) + "\r\n\r\n").encode("iso-8859-1") + (b"" if status == 304 else body))
+        await writer.drain()
+
+    async def update_periodically(self):
+        """Run the incremental update every `update_interval` seconds, one at a time."""
+        from weather_processor import WeatherProcessor  # imports the scraper, only needed here
+
+        processor = WeatherProcessor(source=self.source)
+        processor.db = self.db
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(self.update_interval)
+            print("Running the periodic update...")
+            try:
+                with METRICS.timer("server_update_seconds"):
+                    await loop.run_in_executor(None, processor.update_data)
+            except Exception as e:
+                print("Error updating data:", e)
+
+    async def start(self, host=DEFAULT_HOST, port=DEFAULT_PORT):
+        """Start listening, and the periodic update if it is enabled."""
+        self.server = await asyncio.start_server(self.handle_connection, host, port, limit=MAX_HEADER_BYTES)
+        if self.update_interval:
+            self.update_task = asyncio.create_task(self.update_periodically())
+        return self.server.sockets[0].getsockname()[:2]
+
+    async def stop(self):
+        """Stop listening and the periodic update, and release the readers."""
+        if self.update_task is not None:
+            self.update_task.cancel()
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+        self.executor.shutdown(wait=True)
+
+    async def serve_forever(self, host=DEFAULT_HOST, port=DEFAULT_PORT):
+        """Serve until cancelled."""
+        address = await self.start(host, port)
+        print(f"Serving weather data at http://{address[0]}:{address[1]}/")
+        try:
+            await self.server.serve_forever()
+        finally:
+            await self.stop()
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Serve weather queries and plots over HTTP.")
+    arg_parser.add_argument("--host", default=DEFAULT_HOST)
+    arg_parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    arg_parser.add_argument("--db", default=DB_NAME, help="SQLite database")
+    arg_parser.add_argument("--readers", type=int, default=DEFAULT_READERS, help="concurrent query threads")
+    arg_parser.add_argument("--update-interval", type=float, default=DEFAULT_UPDATE_INTERVAL,
+                            help="seconds between incremental updates (0 disables them)")
+    arg_parser.add_argument("--source", choices=("html", "csv"), default="html",
+                            help="source of the periodic update")
+    args = arg_parser.parse_args()
+
+    import matplotlib
+    matplotlib.use("Agg")
+    db = DBOperations(args.db)
+    db.initialize_db()
+    server = WeatherServer(args.db, readers=args.readers, update_interval=args.update_interval,
+                           source=args.source)
+    try:
+        asyncio.run(server.serve_forever(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
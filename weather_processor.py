@@ -1,14 +1,23 @@
 """
 Module to process weather data.
+
+Matplotlib, NumPy, tkinter and the scraper are imported on first use rather
+than at startup, so the window appears (and `--update` finishes) without paying
+for modules the current run may never need.
 """
 
-import tkinter as tk
-from tkinter import ttk
+import time
+STARTED_AT = time.perf_counter()
+
+import argparse
 import logging
 from datetime import datetime
-from db_operations import DBOperations
-from scrape_weather import WeatherScraper
-from plot_operations import PlotOperations
+from db_operations import DBOperations, DEFAULT_STATION_ID, group_by_month, month_bounds
+from metrics import METRICS
+from query_cache import QueryCache, DEFAULT_MAX_BYTES
+from job_runner import JobRunner
+
+tk = ttk = None  # set by load_tkinter
 
 # Configure logging
 logging.basicConfig(filename='weather_processor.log', level=logging.ERROR,
@@ -17,10 +26,23 @@ logging.basicConfig(filename='weather_processor.log', level=logging.ERROR,
 class WeatherProcessor:
     """
     Class to process weather data.
+    Plot queries are cached in memory, up to `cache_bytes`, until the data changes.
+    Data is downloaded from the month pages or the bulk CSV export (`source`).
     """
-    def __init__(self):
+    def __init__(self, cache_bytes=DEFAULT_MAX_BYTES, source="html"):
         self.db = None
-        self.scraper = WeatherScraper()
+        self.station_id = DEFAULT_STATION_ID
+        self.source = source
+        self._scraper = None
+        self.cache = QueryCache(cache_bytes)
+
+    @property
+    def scraper(self):
+        """The weather scraper, created on first use."""
+        if self._scraper is None:
+            from csv_source import scraper_class
+            self._scraper = scraper_class(self.source)(station_id=self.station_id)
+        return self._scraper
 
     def initialize_db(self):
         """
@@ -29,47 +51,93 @@ class WeatherProcessor:
         self.db = DBOperations()
         self.db.initialize_db()
 
-    def download_full_data(self, start_year, start_month):
+    def download_full_data(self, start_year, start_month, progress=None, cancel_event=None):
         """
         Download full weather data starting from the given year and month.
+        `progress` and `cancel_event` are passed through to the scraper.
         """
         if self.db is None:
             self.initialize_db()
-        self.scraper.scrape_backwards(start_year, start_month)
+        results = self.scraper.scrape_backwards(start_year, start_month, self.db, progress, cancel_event)
+        self.log_failed_months()
+        self.advance_watermark(None, results)
 
     def get_latest_date_from_db(self):
         """
         Get the latest date from the database. 
         """
         try:
-            data = self.db.fetch_data()
-            if data:
-                latest_date = max(entry['date'] for entry in data)
-                return latest_date
-            return None
+            return self.db.get_latest_date(self.station_id)
         except Exception as e:
             logging.error("Error getting latest date from database: %s", e)
             print("Error getting latest date from database. Check the log file for details.")
             return None
 
-    def update_data(self):
+    def get_watermark(self):
+        """
+        Get the high-watermark (last fully synced closed month) of the station.
+        Falls back to the month before the latest stored date when no sync state exists.
+        """
+        from scrape_weather import previous_month
+
+        watermark = self.db.get_sync_state(self.station_id)
+        if watermark is None:
+            latest_date = self.get_latest_date_from_db()
+            if latest_date:
+                latest_year, latest_month, _ = map(int, latest_date.split('-'))
+                watermark = previous_month(latest_year, latest_month)
+        return watermark
+
+    def advance_watermark(self, watermark, results):
+        """
+        Move the high-watermark over every consecutive closed month that returned data
+        and persist it. The current month is still open, so it never becomes the watermark.
+        """
+        now = datetime.now()
+        current = (now.year, now.month)
+        for month in sorted(results):
+            if month >= current or (watermark and month <= watermark):
+                continue
+            if results[month] is None:
+                break  # skipped after a cancel, or failed
+            if not results[month]:
+                if watermark is None:
+                    continue  # months before the station's first data
+                break  # leave the gap to be fetched again by the next update
+            watermark = month
+        if watermark:
+            self.db.set_sync_state(self.station_id, *watermark)
+
+    def update_data(self, progress=None, cancel_event=None):
         """
         Update the data in the database with the latest data.
+        Only the months after the stored high-watermark are fetched, up to and
+        including the current month.
         """
         if self.db is None:
+            self.initialize_db()
+        watermark = self.get_watermark()
+        if watermark is None:
             print("No data found in the database. Please download the full data first.")
             logging.error("Attempted to update data without downloading full data first.")
             return
-        latest_date = self.get_latest_date_from_db()
-        if latest_date:
-            latest_year, latest_month, _ = map(int, latest_date.split('-'))
-            now = datetime.now()
-            if latest_year == now.year and latest_month == now.month:
-                print("The data is up to date.")
-                return
-            self.scraper.scrape_backwards(latest_year, latest_month + 1)
-        else:
-            print("No data found in the database. Please download the full data first.")
+        from scrape_weather import month_range, next_month
+
+        now = datetime.now()
+        start = next_month(*watermark)
+        months = month_range(start, (now.year, now.month))
+        print(f"Updating {len(months)} month(s) starting at {start[0]}-{start[1]:02}...")
+        results = self.scraper.scrape_months(months, self.db, progress, cancel_event)
+        self.log_failed_months()
+        self.advance_watermark(watermark, results)
+
+    def log_failed_months(self):
+        """
+        Log the months the last scrape gave up on. The watermark stops before
+        the first of them, so the next update fetches them again.
+        """
+        for (year, month), error in sorted(self.scraper.failed_months.items()):
+            logging.error("Failed to scrape %d-%02d: %s", year, month, error)
 
     def generate_box_plot(self, start_year, end_year):
         """
@@ -80,10 +148,11 @@ class WeatherProcessor:
             logging.error("Attempted to generate box plot without downloading full data first.")
             return
         try:
-            data = self.db.fetch_data()
-            weather_data = self.organize_data_for_plotting(data)
-            plotter = PlotOperations(weather_data)
-            plotter.plot_boxplot(start_year, end_year)
+            from plot_operations import PlotOperations
+
+            summary = self.get_climate_summary(start_year, end_year)
+            plotter = PlotOperations(summary)
+            plotter.plot_boxplot_summary(start_year, end_year)
         except Exception as e:
             logging.error("Error generating box plot: %s", e)
             print("Error generating box plot. Check the log file for details.")
@@ -97,45 +166,124 @@ class WeatherProcessor:
             logging.error("Attempted to generate line plot without downloading full data first.")
             return
         try:
-            data = self.db.fetch_data()
-            weather_data = self.organize_data_for_plotting(data)
+            from plot_operations import PlotOperations
+
+            weather_data = self.get_plot_data(*month_bounds(year, month))
             plotter = PlotOperations(weather_data)
             plotter.plot_lineplot(year, month)
         except Exception as e:
             logging.error("Error generating line plot: %s", e)
             print("Error generating line plot. Check the log file for details.")
 
+    def box_plot_figure(self, start_year, end_year):
+        """
+        Build the box plot for a range of years as a Figure, without pyplot,
+        so it can be prepared on a worker thread and embedded in the window.
+        """
+        if self.db is None:
+            raise ValueError("No data found in the database. Please download the full data first.")
+        from plot_operations import PlotOperations
+
+        with METRICS.timer("plot_seconds", plot="box"):
+            summary = self.get_climate_summary(start_year, end_year)
+            return PlotOperations(summary).boxplot_summary_figure(start_year, end_year)
+
+    def line_plot_figure(self, year, month):
+        """
+        Build the line plot for a month as a Figure, or None if there is no data.
+        """
+        if self.db is None:
+            raise ValueError("No data found in the database. Please download the full data first.")
+        from plot_operations import PlotOperations
+
+        with METRICS.timer("plot_seconds", plot="line"):
+            weather_data = self.get_plot_data(*month_bounds(year, month))
+            return PlotOperations(weather_data).lineplot_figure(year, month)
+
+    def get_plot_data(self, start_date, end_date):
+        """
+        Get the mean temperatures of a date range organized for plotting.
+        Results are served from the query cache while the data is unchanged.
+        """
+        started = time.perf_counter()
+        station_id = self.station_id
+        generation = self.db.data_generation()
+        key = ("by_month", station_id, start_date, end_date)
+        weather_data = self.cache.get(key, generation)
+        cached = weather_data is not None
+        if weather_data is None:
+            columns = self.get_columns(start_date, end_date, generation)
+            weather_data = self.organize_data_for_plotting(columns)
+            self.cache.put(key, weather_data, generation)
+        METRICS.observe("query_seconds", time.perf_counter() - started, query="plot_data", cached=cached)
+        return weather_data
+
+    def get_climate_summary(self, start_year, end_year):
+        """
+        Get the per-calendar-month summary of a range of years from the
+        monthly_stats table (12 rows per year), cached like the plot data.
+        """
+        started = time.perf_counter()
+        station_id = self.station_id
+        generation = self.db.data_generation()
+        key = ("climate_summary", station_id, start_year, end_year)
+        summary = self.cache.get(key, generation)
+        cached = summary is not None
+        if summary is None:
+            summary = self.db.fetch_climate_summary(station_id, start_year, end_year)
+            self.cache.put(key, summary, generation)
+        METRICS.observe("query_seconds", time.perf_counter() - started, query="climate_summary", cached=cached)
+        return summary
+
+    def get_columns(self, start_date, end_date, generation):
+        """
+        Fetch the columns of a date range, slicing a cached range that covers it
+        when there is one instead of querying the database again.
+        """
+        station_id = self.station_id
+        covering = self.cache.find(
+            lambda key: key[:2] == ("columns", station_id) and key[2] <= start_date and key[3] >= end_date,
+            generation)
+        if covering is not None:
+            import numpy as np
+
+            columns = covering[1]
+            first = np.searchsorted(columns["date"], np.datetime64(start_date), side="left")
+            last = np.searchsorted(columns["date"], np.datetime64(end_date), side="right")
+            return {name: column[first:last] for name, column in columns.items()}
+
+        columns = self.db.fetch_columns(start_date, end_date, station_id)
+        self.cache.put(("columns", station_id, start_date, end_date), columns, generation)
+        return columns
+
     def organize_data_for_plotting(self, data):
         """
-        Organize the data in a format suitable for plotting.
-        """
-        organized_data = {}
-        for entry in data:
-            date = entry['date']
-            if date:
-                try:
-                    year, month, day= map(int, date.split('-'))
-                    if year not in organized_data:
-                        organized_data[year] = {}
-                    if month not in organized_data[year]:
-                        organized_data[year][month] = []
-                    organized_data[year][month].append(entry['avg_temp'])
-                except ValueError as e:
-                    logging.error("Skipping invalid date entry: %s - Error: %s", date, e)
-                    print(f"Skipping invalid date entry: {date} - Error: {e}")
-            else:
-                logging.error("Skipping entry with empty date: %s", entry)
-                print(f"Skipping entry with empty date: {entry}")
-        return organized_data
+        Organize the columns returned by fetch_columns in a format suitable for plotting:
+        {year: {month: array of mean temperatures}}.
+        """
+        return group_by_month(data["date"], data["avg_temp"])
+
+
+def load_tkinter():
+    """Import tkinter, which headless runs never need."""
+    global tk, ttk
+    import tkinter as tk
+    from tkinter import ttk
+
 
 class WeatherProcessorUI:
     """
     Class to create the user interface for the weather data processor.
+    Downloads, updates and plot queries run as background jobs so the window
+    stays responsive; plots are embedded in their own windows.
     """
     def __init__(self, root, processor):
+        load_tkinter()
         self.processor = processor
         self.root = root
         self.root.title("Weather Data Processor")
+        self.jobs = JobRunner(root)
+        self.current_job = None
 
         self.create_widgets()
 
@@ -200,63 +348,145 @@ class WeatherProcessorUI:
         self.lineplot_button = ttk.Button(lineplot_frame, text="Generate Line Plot", command=self.generate_line_plot)
         self.lineplot_button.grid(row=2, column=0, columnspan=2, pady=5, sticky="ew")
 
+        # Progress section
+        progress_frame = ttk.LabelFrame(main_frame, text="Progress", padding="10 10 10 10")
+        progress_frame.grid(row=5, column=0, columnspan=2, pady=10, sticky="ew")
+        progress_frame.grid_columnconfigure(0, weight=1)
+
+        self.progress_bar = ttk.Progressbar(progress_frame, mode="determinate")
+        self.progress_bar.grid(row=0, column=0, sticky="ew")
+        self.cancel_button = ttk.Button(progress_frame, text="Cancel", command=self.cancel_job,
+                                        state="disabled")
+        self.cancel_button.grid(row=0, column=1, padx=(10, 0))
+        self.status_label = ttk.Label(progress_frame, text="Idle")
+        self.status_label.grid(row=1, column=0, columnspan=2, sticky="w")
+
         # Exit button
-        self.exit_button = ttk.Button(main_frame, text="Exit", command=self.root.quit)
-        self.exit_button.grid(row=5, column=0, columnspan=2, pady=5, sticky="ew")
+        self.exit_button = ttk.Button(main_frame, text="Exit", command=self.exit)
+        self.exit_button.grid(row=6, column=0, columnspan=2, pady=5, sticky="ew")
 
         # Configure grid to scale properly
-        for i in range(6):
+        for i in range(7):
             main_frame.grid_rowconfigure(i, weight=1)
         main_frame.grid_columnconfigure(0, weight=1)
         main_frame.grid_columnconfigure(1, weight=1)
 
+    def start_download_job(self, name, func):
+        """
+        Run a download or update in the background with live progress and cancel.
+        """
+        if self.current_job is not None:
+            print("A download is already running.")
+            return
+        self.download_button.config(state="disabled")
+        self.update_button.config(state="disabled")
+        self.cancel_button.config(state="normal")
+        self.progress_bar.config(value=0, maximum=1)
+        self.status_label.config(text=f"{name}...")
+        self.current_job = self.jobs.start(name, func, on_done=self.finish_download,
+                                           on_error=self.fail_download, on_progress=self.show_progress)
+
+    def show_progress(self, months_done, months_total, rows_written):
+        """Update the progress bar (runs on the main thread)."""
+        self.progress_bar.config(value=months_done, maximum=max(months_total, 1))
+        self.status_label.config(text=f"{months_done}/{months_total} months, {rows_written} rows written")
+
+    def finish_download(self, _result):
+        """Reset the controls after a download or update."""
+        cancelled = self.current_job is not None and self.current_job.cancelled
+        self.status_label.config(text="Cancelled." if cancelled else "Done.")
+        self.reset_download_controls()
+
+    def fail_download(self, error):
+        """Report a failed download or update."""
+        logging.error("Error downloading data: %s", error)
+        print("Error downloading data. Check the log file for details.")
+        self.status_label.config(text="Failed. Check the log file for details.")
+        self.reset_download_controls()
+
+    def reset_download_controls(self):
+        """Re-enable the download buttons."""
+        self.current_job = None
+        self.download_button.config(state="normal")
+        self.update_button.config(state="normal")
+        self.cancel_button.config(state="disabled")
+
+    def cancel_job(self):
+        """Cancel the running download or update."""
+        if self.current_job is not None:
+            self.current_job.cancel()
+            self.status_label.config(text="Cancelling...")
+
+    def exit(self):
+        """Cancel running jobs and close the application."""
+        self.jobs.cancel_all()
+        self.root.quit()
+
     def download_data(self):
         """Download full weather data."""
-        try:
-            now = datetime.now()
-            start_year= now.year
-            start_month = now.month
-            self.processor.download_full_data(start_year, start_month)
-        except ValueError as e:
-            logging.error("Error parsing start year: %s", e)
-            print("Error parsing start year. Check the log file for details.")
-        except Exception as e:
-            logging.error("Error downloading data: %s", e)
-            print("Error downloading data. Check the log file for details.")
+        now = datetime.now()
+        start_year = now.year
+        start_month = now.month
+        self.start_download_job("Downloading", lambda progress, cancel_event:
+                                self.processor.download_full_data(start_year, start_month,
+                                                                  progress, cancel_event))
 
     def update_data(self):
         """Update the weather data."""
-        try:
-            self.processor.update_data()
-        except Exception as e:
-            logging.error("Error updating data: %s", e)
-            print("Error updating data. Check the log file for details.")
+        self.start_download_job("Updating", self.processor.update_data)
 
     def generate_box_plot(self):
         """Generate a box plot."""
         try:
             start_year = self.validate_year(self.start_year_entry.get())
             end_year = self.validate_year(self.end_year_entry.get())
-            self.processor.generate_box_plot(start_year, end_year)
         except ValueError as e:
             logging.error("Error parsing years for box plot: %s", e)
             print("Error parsing years for box plot. Check the log file for details.")
-        except Exception as e:
-            logging.error("Error generating box plot: %s", e)
-            print("Error generating box plot. Check the log file for details.")
+            return
+        self.status_label.config(text="Preparing box plot...")
+        self.jobs.start("box-plot",
+                        lambda progress, cancel_event: self.processor.box_plot_figure(start_year, end_year),
+                        on_done=lambda fig: self.show_figure(fig, "Box Plot"),
+                        on_error=lambda e: self.plot_failed("box plot", e))
 
     def generate_line_plot(self):
         """Generate a line plot."""
         try:
             year = self.validate_year(self.year_entry.get())
             month = self.validate_month(self.month_entry.get())
-            self.processor.generate_line_plot(year, month)
         except ValueError as e:
             logging.error("Error parsing year or month for line plot: %s", e)
             print("Error parsing year or month for line plot. Check the log file for details.")
-        except Exception as e:
-            logging.error("Error generating line plot: %s", e)
-            print("Error generating line plot. Check the log file for details.")
+            return
+        self.status_label.config(text="Preparing line plot...")
+        self.jobs.start("line-plot",
+                        lambda progress, cancel_event: self.processor.line_plot_figure(year, month),
+                        on_done=lambda fig: self.show_figure(fig, "Line Plot", f"{year}-{month:02}"),
+                        on_error=lambda e: self.plot_failed("line plot", e))
+
+    def show_figure(self, fig, title, month_label=None):
+        """Embed a finished figure in a new window (runs on the main thread)."""
+        if fig is None:
+            print(f"No data available for {month_label}")
+            self.status_label.config(text=f"No data available for {month_label}.")
+            return
+        self.status_label.config(text="Idle")
+        from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg, NavigationToolbar2Tk
+
+        window = tk.Toplevel(self.root)
+        window.title(title)
+        canvas = FigureCanvasTkAgg(fig, master=window)
+        toolbar = NavigationToolbar2Tk(canvas, window)
+        toolbar.update()
+        canvas.get_tk_widget().pack(fill=tk.BOTH, expand=True)
+        canvas.draw()
+
+    def plot_failed(self, name, error):
+        """Report a failed plot."""
+        logging.error("Error generating %s: %s", name, error)
+        print(f"Error generating {name}. Check the log file for details.")
+        self.status_label.config(text=f"Error generating {name}.")
 
     def validate_year(self, year_str):
         """Validate the year input."""
@@ -277,7 +507,44 @@ class WeatherProcessorUI:
         return month
 
 if __name__ == "__main__":
-    processor = WeatherProcessor()
+    arg_parser = argparse.ArgumentParser(description="Weather data processor")
+    arg_parser.add_argument("--update", action="store_true",
+                            help="run an incremental update without opening the window")
+    arg_parser.add_argument("--startup-time", action="store_true",
+                            help="print the time until the window is shown (or the update finishes) and exit")
+    arg_parser.add_argument("--metrics-json", metavar="PATH", help="write a JSON metrics summary on exit")
+    arg_parser.add_argument("--metrics-prom", metavar="PATH",
+                            help="write metrics in the Prometheus text format on exit")
+    arg_parser.add_argument("--source", choices=("html", "csv"), default="html",
+                            help="download month pages (html) or a bulk CSV file per year (csv)")
+    args = arg_parser.parse_args()
+
+    def write_metrics():
+        """Export the collected metrics to the requested files."""
+        if args.metrics_json:
+            METRICS.write_json(args.metrics_json)
+        if args.metrics_prom:
+            METRICS.write_prometheus(args.metrics_prom)
+
+    def report_startup(what):
+        """Print the time since the interpreter started importing this module."""
+        print(f"Startup: {what} after {(time.perf_counter() - STARTED_AT) * 1000:.0f} ms")
+
+    processor = WeatherProcessor(source=args.source)
+    if args.update:
+        processor.update_data()
+        if args.startup_time:
+            report_startup("update finished")
+        write_metrics()
+        raise SystemExit(0)
+    load_tkinter()
     root = tk.Tk()
     app = WeatherProcessorUI(root, processor)
+    if args.startup_time:
+        def window_shown():
+            root.update_idletasks()
+            report_startup("window shown")
+            root.destroy()
+        root.after_idle(window_shown)
     root.mainloop()
+    write_metrics()
@@ -10,7 +10,7 @@ a = Analysis(
     hookspath=[],
     hooksconfig={},
     runtime_hooks=[],
-    excludes=[],
+    excludes=['IPython', 'PyQt5', 'PyQt6', 'PySide2', 'PySide6', 'pandas', 'scipy', 'tornado'],
     noarchive=False,
     optimize=0,
 )